@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class LibraryApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library_api'
+
+    def ready(self):
+        from . import signals  # noqa: F401
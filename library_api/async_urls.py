@@ -0,0 +1,10 @@
+from django.urls import path
+from .async_views import books_view, personal_borrow_history_view, user_borrow_history_view, borrow_request_events_view
+
+# Routes served by async views under ASGI; everything else falls through to library_api.urls
+urlpatterns = [
+    path('user/books/', books_view, name='books'),
+    path('user/borrow-history/', personal_borrow_history_view, name='personal-borrow-history'),
+    path('librarian/user-history/<int:user_id>/', user_borrow_history_view, name='user-borrow-history'),
+    path('librarian/borrow-requests/events/', borrow_request_events_view, name='borrow-request-events'),
+]
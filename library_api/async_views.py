@@ -0,0 +1,188 @@
+import asyncio
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.request import Request
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from .authentication import CachedJWTAuthentication
+from .catalog import catalog_cache, catalog_cache_timeout, aget_catalog_version, catalog_response_key
+from .events import get_event_hub
+from .models import User
+from .renderers import FastJSONRenderer
+from .routers import route_reads_to_replica
+from .serializers import book_list_serializer, borrow_request_list_serializer
+from .services import borrow_history_querysets
+from .views import BooksView, build_catalog_page, sparse_fieldset, parse_history_range
+
+# Async variants of the read-heavy endpoints, routed in place of the DRF views
+# when serving through ASGI (see library_management/asgi_urls.py). They validate
+# the JWT in the event loop and use the async ORM, so a slow read waits on the
+# database without holding a worker thread. Other methods on the same routes
+# are handed to the regular sync views.
+
+jwt_authentication = CachedJWTAuthentication()
+
+sync_books_view = sync_to_async(BooksView.as_view())
+
+
+json_renderer = FastJSONRenderer()
+
+
+def json_response(data, status=200):
+    # Same bytes as the DRF views produce for the same data
+    return HttpResponse(json_renderer.render(data), status=status, content_type=json_renderer.media_type)
+
+
+def unauthorized(detail):
+    response = json_response({"detail": detail}, status=401)
+    response['WWW-Authenticate'] = 'Bearer realm="api"'
+    return response
+
+
+async def authenticate(request):
+    """
+    Async counterpart of CachedJWTAuthentication.authenticate. Returns the user or an error response.
+    """
+    header = jwt_authentication.get_header(request)
+    raw_token = jwt_authentication.get_raw_token(header) if header is not None else None
+    if raw_token is None:
+        return None, unauthorized("Authentication credentials were not provided.")
+    try:
+        validated_token = jwt_authentication.get_validated_token(raw_token)
+        user = jwt_authentication.get_cached_user(validated_token)
+        if user is None:
+            user = await sync_to_async(jwt_authentication.get_user)(validated_token)
+    except (InvalidToken, TokenError):
+        return None, unauthorized("Given token not valid for any token type")
+    except AuthenticationFailed as e:
+        return None, unauthorized(str(e.detail))
+    return user, None
+
+
+async def serialize_borrow_history(request, list_serializer, **filters):
+    # Picking the tables needs the archive horizon, which is a query
+    date_range = parse_history_range(request.GET)
+    querysets = await sync_to_async(borrow_history_querysets)(*date_range, **filters)
+    rows = [row for queryset in querysets async for row in list_serializer.values(queryset)]
+    return list_serializer.serialize(rows)
+
+
+@csrf_exempt
+async def books_view(request):
+    if request.method != 'GET':
+        return await sync_books_view(request)
+
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    try:
+        list_serializer = sparse_fieldset(request.GET, book_list_serializer, always=['id'])
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+
+    key, etag = catalog_response_key(request, await aget_catalog_version())
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+        response = HttpResponse(status=304)
+    else:
+        cache = catalog_cache()
+        data = await cache.aget(key)
+        if data is None:
+            # Cursor pagination runs its query synchronously; keep it off the event loop
+            data = await sync_to_async(build_catalog_page)(Request(request), list_serializer)
+            await cache.aset(key, data, catalog_cache_timeout(cache))
+        response = json_response(data)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+async def personal_borrow_history_view(request):
+    if request.method != 'GET':
+        return HttpResponse(status=405, headers={'Allow': 'GET'})
+    user, error = await authenticate(request)
+    if error:
+        return error
+    await sync_to_async(route_reads_to_replica)(request, user)
+    try:
+        list_serializer = sparse_fieldset(request.GET, borrow_request_list_serializer)
+        data = await serialize_borrow_history(request, list_serializer, user=user)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+    return json_response(data)
+
+
+async def user_borrow_history_view(request, user_id):
+    if request.method != 'GET':
+        return HttpResponse(status=405, headers={'Allow': 'GET'})
+    user, error = await authenticate(request)
+    if error:
+        return error
+    await sync_to_async(route_reads_to_replica)(request, user)
+    if not await User.objects.filter(id=user_id).aexists():
+        return json_response({"error": "User not found"}, status=404)
+    try:
+        list_serializer = sparse_fieldset(request.GET, borrow_request_list_serializer)
+        data = await serialize_borrow_history(request, list_serializer, user_id=user_id)
+    except ValueError as e:
+        return json_response({"error": str(e)}, status=400)
+    return json_response(data)
+
+
+# Sent when events the client has not seen are no longer buffered: it should
+# re-read the queue from librarian/borrow-requests/ and keep listening
+RESET_EVENT = b'event: reset\ndata: {}\n\n'
+
+
+async def borrow_request_event_stream(hub, last_event_id):
+    keepalive = getattr(settings, 'BORROW_EVENTS_KEEPALIVE', 15)
+    subscription = await hub.subscribe(last_event_id)
+    try:
+        yield b'retry: 3000\n\n'
+        if subscription.reset:
+            yield RESET_EVENT
+        else:
+            for event in subscription.backlog:
+                yield event.encode()
+        while True:
+            try:
+                event = await asyncio.wait_for(subscription.queue.get(), keepalive)
+            except asyncio.TimeoutError:
+                # Keeps proxies from closing an idle connection
+                yield b': keepalive\n\n'
+                continue
+            if event is None:
+                yield RESET_EVENT
+                return
+            yield event.encode()
+    finally:
+        hub.unsubscribe(subscription)
+
+
+# Server-sent events for new and status-changed borrow requests, replacing
+# polling of the librarian queue. A reconnecting client sends Last-Event-ID
+# (or ?last_event_id=) and first receives the buffered events after it.
+async def borrow_request_events_view(request):
+    if request.method != 'GET':
+        return HttpResponse(status=405, headers={'Allow': 'GET'})
+    user, error = await authenticate(request)
+    if error:
+        return error
+
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    if last_event_id is not None:
+        if not last_event_id.isdigit():
+            return json_response({"error": "Invalid Last-Event-ID"}, status=400)
+        last_event_id = int(last_event_id)
+
+    response = StreamingHttpResponse(borrow_request_event_stream(get_event_hub(), last_event_id),
+                                     content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
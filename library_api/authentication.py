@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .models import User
+
+# Claims copied into tokens at issuance (see LibraryTokenObtainPairSerializer)
+TRUSTED_CLAIMS = ('username', 'role', 'is_staff')
+
+
+class UserCache:
+    """
+    Bounded LRU of authenticated users keyed by (user id, token version), where
+    the version is the password hash claim simplejwt embeds when
+    CHECK_REVOKE_TOKEN is on. Entries expire after a TTL so changes made in
+    other processes are picked up; local changes evict them right away.
+    """
+
+    def __init__(self, max_size=None, ttl=None):
+        self.max_size = max_size or getattr(settings, 'AUTH_USER_CACHE_SIZE', 10000)
+        self.ttl = ttl if ttl is not None else getattr(settings, 'AUTH_USER_CACHE_TTL', 60)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key, user):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, user)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == user_id]:
+                del self._entries[key]
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+user_cache = UserCache()
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    """
+    JWTAuthentication that resolves users from user_cache, so a request from a
+    recently seen user issues no query. With AUTH_TRUST_TOKEN_CLAIMS enabled,
+    tokens carrying the claims in TRUSTED_CLAIMS are turned into a user without
+    any lookup; such tokens stay usable until they expire.
+    """
+
+    def get_user(self, validated_token):
+        user = self.get_cached_user(validated_token)
+        if user is None:
+            user = super().get_user(validated_token)
+            user_cache.set(self.cache_key(validated_token), user)
+        return user
+
+    def get_cached_user(self, validated_token):
+        if getattr(settings, 'AUTH_TRUST_TOKEN_CLAIMS', False) and all(c in validated_token for c in TRUSTED_CLAIMS):
+            return self.user_from_claims(validated_token)
+        return user_cache.get(self.cache_key(validated_token))
+
+    def cache_key(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken("Token contained no recognizable user identification")
+        return user_id, validated_token.get(api_settings.REVOKE_TOKEN_CLAIM)
+
+    def user_from_claims(self, validated_token):
+        user = User(
+            username=validated_token['username'],
+            role=validated_token['role'],
+            is_staff=validated_token['is_staff'],
+            is_active=True,
+        )
+        setattr(user, api_settings.USER_ID_FIELD, validated_token[api_settings.USER_ID_CLAIM])
+        return user
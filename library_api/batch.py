@@ -0,0 +1,201 @@
+import contextvars
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.http import HttpRequest, QueryDict
+from django.urls import Resolver404, resolve
+from rest_framework.permissions import SAFE_METHODS
+
+from .idempotency import releasing_on_rollback
+from .routers import RoutingState, current_routing
+
+logger = logging.getLogger(__name__)
+
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE')
+
+# Request headers a sub-request inherits from the batch request; everything
+# else comes from the sub-request's own "headers"
+INHERITED_META = ('SERVER_NAME', 'SERVER_PORT', 'SERVER_PROTOCOL', 'REMOTE_ADDR', 'HTTP_HOST',
+                  'HTTP_X_FORWARDED_FOR', 'HTTP_X_FORWARDED_PROTO', 'wsgi.url_scheme')
+
+
+class InvalidBatch(Exception):
+    pass
+
+
+class BatchRollback(Exception):
+    pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def read_pool():
+    # Shared so its threads keep their persistent database connections
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=getattr(settings, 'BATCH_MAX_WORKERS', 4),
+                                           thread_name_prefix='batch-read')
+    return _pool
+
+
+def parse_batch(payload):
+    """
+    Validates the list of sub-requests and resolves each against the API urlconf.
+    Returns (spec, method, path, query, resolver match) tuples. Raises InvalidBatch.
+    """
+    specs = payload.get('requests') if isinstance(payload, dict) else None
+    if not isinstance(specs, list) or not specs:
+        raise InvalidBatch("Expected a non-empty list of sub-requests in 'requests'.")
+    max_size = getattr(settings, 'BATCH_MAX_REQUESTS', 20)
+    if len(specs) > max_size:
+        raise InvalidBatch(f"A batch may contain at most {max_size} sub-requests.")
+
+    parsed = []
+    for index, spec in enumerate(specs):
+        if not isinstance(spec, dict) or not isinstance(spec.get('path'), str):
+            raise InvalidBatch(f"Sub-request {index}: expected an object with 'method' and 'path'.")
+        method = str(spec.get('method', 'GET')).upper()
+        if method not in METHODS:
+            raise InvalidBatch(f"Sub-request {index}: unsupported method {method}.")
+        if not isinstance(spec.get('headers', {}), dict):
+            raise InvalidBatch(f"Sub-request {index}: 'headers' must be an object.")
+        path, _, query = spec['path'].partition('?')
+        try:
+            match = resolve(path, urlconf=settings.ROOT_URLCONF)
+        except Resolver404:
+            raise InvalidBatch(f"Sub-request {index}: no route for {path}.")
+        view_module = getattr(match.func, 'cls', match.func).__module__
+        if not view_module.startswith('library_api.') or match.url_name == 'batch':
+            raise InvalidBatch(f"Sub-request {index}: {path} cannot be called from a batch.")
+        parsed.append((spec, method, path, query, match))
+    return parsed
+
+
+def build_subrequest(parent, user, auth, spec, method, path, query, match):
+    request = HttpRequest()
+    request.method = method
+    request.path = request.path_info = path
+    request.GET = QueryDict(query)
+    request.META = {key: parent.META[key] for key in INHERITED_META if key in parent.META}
+    request.META.update({
+        'REQUEST_METHOD': method,
+        'PATH_INFO': path,
+        'QUERY_STRING': query,
+        'HTTP_ACCEPT': 'application/json',
+    })
+    for name, value in spec.get('headers', {}).items():
+        request.META['HTTP_' + name.upper().replace('-', '_')] = str(value)
+
+    body = b''
+    if 'body' in spec:
+        body = json.dumps(spec['body']).encode('utf-8')
+        request.META['CONTENT_TYPE'] = 'application/json'
+    request.META['CONTENT_LENGTH'] = str(len(body))
+    request._stream = io.BytesIO(body)
+    request._read_started = False
+
+    # The batch request was authenticated once; DRF uses these instead of
+    # running its authentication classes again
+    request._force_auth_user = user
+    request._force_auth_token = auth
+    request.user = user
+    request.resolver_match = match
+    return request
+
+
+def response_data(response):
+    if hasattr(response, 'render'):
+        response.render()
+    content = b''.join(response.streaming_content) if response.streaming else response.content
+    if response.get('Content-Type', '').startswith('application/json') and content:
+        body = json.loads(content)
+    else:
+        body = content.decode(response.charset or 'utf-8', errors='replace')
+    headers = {name: value for name, value in response.items() if name.lower() != 'content-length'}
+    return {"status": response.status_code, "headers": headers, "body": body}
+
+
+def run_subrequest(subrequest):
+    """
+    Calls the view of one sub-request and returns its result entry. Each
+    sub-request gets its own database routing state; a write is recorded on
+    the batch's, so the user's reads stay on the primary afterwards.
+    """
+    parent_routing = current_routing.get()
+    token = current_routing.set(RoutingState())
+    try:
+        match = subrequest.resolver_match
+        return response_data(match.func(subrequest, *match.args, **match.kwargs))
+    except Exception:
+        logger.exception("Batch sub-request %s %s failed", subrequest.method, subrequest.path)
+        return {"status": 500, "headers": {}, "body": {"error": "Internal server error"}}
+    finally:
+        if parent_routing is not None and current_routing.get().wrote:
+            parent_routing.wrote = True
+        current_routing.reset(token)
+
+
+def run_in_pool(subrequest):
+    close_old_connections()
+    try:
+        return run_subrequest(subrequest)
+    finally:
+        close_old_connections()
+
+
+def run_reads(subrequests):
+    if len(subrequests) == 1:
+        return [run_subrequest(subrequests[0])]
+    pool = read_pool()
+    futures = [pool.submit(contextvars.copy_context().run, run_in_pool, subrequest) for subrequest in subrequests]
+    return [future.result() for future in futures]
+
+
+def execute_batch(subrequests, atomic=False):
+    """
+    Runs the sub-requests and returns their results in order, plus whether the
+    writes were rolled back.
+
+    Without `atomic`, each run of consecutive reads executes concurrently on the
+    read pool and every write executes alone, in order, so reads listed after a
+    write see it. With `atomic`, everything runs in order in one transaction,
+    which is rolled back if any write fails; the sub-requests after the failed
+    write are not executed. A sub-request that leaves the transaction marked
+    for rollback (it caught a database error) counts as a failed write.
+    """
+    if atomic:
+        results = []
+        try:
+            with releasing_on_rollback(), transaction.atomic():
+                for subrequest in subrequests:
+                    result = run_subrequest(subrequest)
+                    results.append(result)
+                    failed = subrequest.method not in SAFE_METHODS and result["status"] >= 400
+                    if failed or transaction.get_rollback():
+                        raise BatchRollback()
+        except BatchRollback:
+            skipped = {"status": 424, "headers": {}, "body": {"error": "Not executed: an earlier write failed."}}
+            return results + [skipped] * (len(subrequests) - len(results)), True
+        return results, False
+
+    results, reads = [], []
+    for subrequest in subrequests:
+        if subrequest.method in SAFE_METHODS:
+            reads.append(subrequest)
+            continue
+        if reads:
+            results.extend(run_reads(reads))
+            reads = []
+        results.append(run_subrequest(subrequest))
+    if reads:
+        results.extend(run_reads(reads))
+    return results, False
@@ -0,0 +1,71 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+
+CATALOG_VERSION_KEY = 'catalog:version'
+
+
+def catalog_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def catalog_cache_timeout(cache):
+    """
+    How long catalog pages, and the version they are keyed on, stay cached. A
+    local-memory cache belongs to one worker process and never sees the writes
+    made through the others, so it only keeps them for
+    CATALOG_LOCAL_CACHE_TIMEOUT seconds.
+    """
+    if isinstance(cache, LocMemCache):
+        return getattr(settings, 'CATALOG_LOCAL_CACHE_TIMEOUT', 5)
+    return getattr(settings, 'CATALOG_CACHE_TIMEOUT', 3600)
+
+
+def catalog_version_seed(cache):
+    # Seed from the clock so a lost counter never reuses an old version. A
+    # shared counter lives until evicted; a local one expires with the pages.
+    timeout = catalog_cache_timeout(cache) if isinstance(cache, LocMemCache) else None
+    return int(time.time() * 1000), timeout
+
+
+def get_catalog_version():
+    cache = catalog_cache()
+    version = cache.get(CATALOG_VERSION_KEY)
+    if version is None:
+        seed, timeout = catalog_version_seed(cache)
+        cache.add(CATALOG_VERSION_KEY, seed, timeout=timeout)
+        version = cache.get(CATALOG_VERSION_KEY)
+    return version
+
+
+async def aget_catalog_version():
+    # For async views: a network cache would otherwise block the event loop
+    cache = catalog_cache()
+    version = await cache.aget(CATALOG_VERSION_KEY)
+    if version is None:
+        seed, timeout = catalog_version_seed(cache)
+        await cache.aadd(CATALOG_VERSION_KEY, seed, timeout=timeout)
+        version = await cache.aget(CATALOG_VERSION_KEY)
+    return version
+
+
+def bump_catalog_version():
+    cache = catalog_cache()
+    try:
+        cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        get_catalog_version()
+        cache.incr(CATALOG_VERSION_KEY)
+
+
+def catalog_response_key(request, version):
+    """
+    Cache key and strong ETag for one catalog response. The body only depends on
+    the catalog version and the requested URL (page cursor, page size, host), so
+    both are derived from those alone.
+    """
+    variant = hashlib.sha1(request.build_absolute_uri().encode('utf-8')).hexdigest()
+    return f'catalog:{version}:{variant}', f'"{version}-{variant[:16]}"'
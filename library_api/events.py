@@ -0,0 +1,306 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class Event:
+    __slots__ = ('id', 'type', 'data')
+
+    def __init__(self, id, type, data):
+        self.id = id
+        self.type = type
+        self.data = data
+
+    def encode(self):
+        # One server-sent event; `id` is what the client echoes as Last-Event-ID
+        return f'id: {self.id}\nevent: {self.type}\ndata: {json.dumps(self.data)}\n\n'.encode('utf-8')
+
+
+class Subscription:
+    """
+    One listener, owned by an event loop. `backlog` holds the buffered events
+    after the requested Last-Event-ID; `reset` is set when some of them were
+    already evicted (or the listener fell too far behind) and the client has
+    to re-read the queue.
+    """
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.backlog = []
+        self.reset = False
+
+    def offer(self, event):
+        # Runs on the subscriber's loop
+        if self.reset:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # Too far behind: drop what is queued and wake the stream with None
+            self.reset = True
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(None)
+
+
+class InProcessEventHub:
+    """
+    Fans borrow request events out to the listeners of this process. Publishing
+    is thread-safe (sync views call it); listeners are asyncio tasks of the
+    ASGI event loop. The last BORROW_EVENTS_BUFFER_SIZE events are kept so a
+    reconnecting client can resume from its Last-Event-ID. Ids continue from
+    the start time in milliseconds, so those of an earlier run of the process
+    are lower than any held now and their clients are told to reset.
+    """
+
+    def __init__(self):
+        self.buffer_size = getattr(settings, 'BORROW_EVENTS_BUFFER_SIZE', 1000)
+        self.buffer = deque(maxlen=self.buffer_size)
+        self.last_id = time.time_ns() // 1_000_000
+        # Events up to this id are not held, nor were they ever by this process
+        self.evicted_id = self.last_id
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def publish(self, type, data):
+        with self.lock:
+            self.last_id += 1
+            event = Event(self.last_id, type, data)
+            subscriptions = self.store(event)
+        self.notify(subscriptions, event)
+
+    def store(self, event):
+        # Called with the lock held; ids are assigned in publish order
+        if len(self.buffer) == self.buffer.maxlen:
+            self.evicted_id = self.buffer[0].id
+        self.buffer.append(event)
+        return list(self.subscriptions)
+
+    def notify(self, subscriptions, event):
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.offer, event)
+            except RuntimeError:
+                # The loop is closed; its listener is gone
+                self.unsubscribe(subscription)
+
+    async def subscribe(self, last_event_id=None):
+        """
+        Registers a listener on the running loop. Events published from now on
+        are queued for it; with a `last_event_id`, the buffered events after it
+        are returned in `backlog` first.
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.buffer_size)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            if last_event_id is not None:
+                subscription.reset = not self.evicted_id <= last_event_id <= self.last_id
+                subscription.backlog = [event for event in self.buffer if event.id > last_event_id]
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+
+class SpoolEventHub(InProcessEventHub):
+    """
+    Local stand-in for a broker, for running several worker processes on one
+    machine. Events are appended to a spool file under an exclusive lock and
+    every process tails it to feed its own listeners. Spool files are numbered
+    generations of BORROW_EVENTS_SPOOL_PATH (events.spool.0, events.spool.1,
+    ...): once one would grow past BORROW_EVENTS_SPOOL_MAX_BYTES the next is
+    started, and the one before the previous removed. An event's id is its
+    generation times GENERATION_SPAN plus its byte offset plus one, so ids are
+    shared by all processes and only grow: a client can resume on any of them,
+    and the events it missed that are no longer buffered, up to
+    BORROW_EVENTS_BUFFER_SIZE of them, are read back from the spool.
+    """
+    GENERATION_SPAN = 10 ** 12
+
+    def __init__(self):
+        super().__init__()
+        self.path = str(settings.BORROW_EVENTS_SPOOL_PATH)
+        self.max_bytes = getattr(settings, 'BORROW_EVENTS_SPOOL_MAX_BYTES', 64 * 1024 * 1024)
+        self.poll_interval = getattr(settings, 'BORROW_EVENTS_SPOOL_POLL', 0.2)
+        self.generation = self.current_generation()
+        with open(self.spool_file(self.generation), 'ab') as spool:
+            self.position = spool.seek(0, os.SEEK_END)
+        self.tailer = threading.Thread(target=self.tail, name='borrow-events-spool', daemon=True)
+        self.tailer.start()
+
+    def spool_file(self, generation):
+        return f'{self.path}.{generation}'
+
+    def current_generation(self):
+        directory, name = os.path.split(self.path)
+        generations = [int(entry[len(name) + 1:]) for entry in os.listdir(directory or '.')
+                       if entry.startswith(name + '.') and entry[len(name) + 1:].isdigit()]
+        return max(generations, default=0)
+
+    def event_id(self, generation, offset):
+        return generation * self.GENERATION_SPAN + offset + 1
+
+    def publish(self, type, data):
+        import fcntl  # POSIX only; imported here so the module loads on any platform
+
+        line = json.dumps({"type": type, "data": data}).encode('utf-8') + b'\n'
+        with open(self.path + '.lock', 'ab') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                generation = self.current_generation()
+                try:
+                    full = os.path.getsize(self.spool_file(generation)) + len(line) > self.max_bytes
+                except FileNotFoundError:
+                    full = False
+                if full:
+                    generation += 1
+                    # Tailers still reading the previous file finish it first
+                    for old in range(generation - 2, -1, -1):
+                        try:
+                            os.remove(self.spool_file(old))
+                        except FileNotFoundError:
+                            break
+                with open(self.spool_file(generation), 'ab') as spool:
+                    spool.write(line)
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def tail(self):
+        while True:
+            time.sleep(self.poll_interval)
+            try:
+                self.read_new_events()
+            except Exception:
+                logger.exception("Reading the borrow event spool failed")
+
+    def read_new_events(self):
+        while True:
+            # Nothing is written to a file once the next one exists
+            rotated = os.path.exists(self.spool_file(self.generation + 1))
+            try:
+                self.read_generation()
+            except FileNotFoundError:
+                logger.warning("Borrow event spool %s was removed before it was read",
+                               self.spool_file(self.generation))
+                rotated = True
+            if not rotated:
+                return
+            with self.lock:
+                self.generation += 1
+                self.position = 0
+
+    def read_generation(self):
+        with open(self.spool_file(self.generation), 'rb') as spool:
+            spool.seek(self.position)
+            while True:
+                offset = spool.tell()
+                line = spool.readline()
+                if not line.endswith(b'\n'):
+                    # Not there yet, or only partially written
+                    break
+                message = json.loads(line)
+                event = Event(self.event_id(self.generation, offset), message["type"], message["data"])
+                with self.lock:
+                    subscriptions = self.store(event)
+                    # Everything before it is buffered now, or was evicted
+                    self.position = spool.tell()
+                self.notify(subscriptions, event)
+
+    async def subscribe(self, last_event_id=None):
+        subscription = Subscription(asyncio.get_running_loop(), self.buffer_size)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            if last_event_id is None:
+                return subscription
+            buffered = [event for event in self.buffer if event.id > last_event_id]
+            # Below the id of the next event to be read; those from `until` on
+            # are buffered, or will be queued for the subscription
+            next_id = self.event_id(self.generation, self.position)
+            until = self.buffer[0].id if self.buffer else next_id
+
+        # The events between the client's and `until` are read back without
+        # holding up the event loop or the tailer
+        missed = []
+        if last_event_id < until:
+            missed = await asyncio.to_thread(self.read_spool, last_event_id, until)
+        subscription.reset = missed is None or last_event_id >= next_id
+        subscription.backlog = (missed or []) + buffered
+        return subscription
+
+    def read_spool(self, last_event_id, until):
+        """
+        The events after `last_event_id` with an id below `until`, or None when
+        some are gone with their spool file or there are more than a buffer of
+        them.
+        """
+        events = []
+        generation, offset = divmod(last_event_id - 1, self.GENERATION_SPAN) if last_event_id else (0, 0)
+        skip = bool(last_event_id)
+        while True:
+            try:
+                spool = open(self.spool_file(generation), 'rb')
+            except FileNotFoundError:
+                return None
+            with spool:
+                spool.seek(offset)
+                if skip:
+                    # The client's own event
+                    spool.readline()
+                    skip = False
+                while True:
+                    event_id = self.event_id(generation, spool.tell())
+                    if event_id >= until:
+                        return events
+                    line = spool.readline()
+                    if not line.endswith(b'\n'):
+                        break
+                    if len(events) == self.buffer_size:
+                        return None
+                    message = json.loads(line)
+                    events.append(Event(event_id, message["type"], message["data"]))
+            generation, offset = generation + 1, 0
+
+
+_hub = None
+_hub_lock = threading.Lock()
+
+
+def get_event_hub():
+    global _hub
+    if _hub is None:
+        with _hub_lock:
+            if _hub is None:
+                path = getattr(settings, 'BORROW_EVENTS_HUB', 'library_api.events.InProcessEventHub')
+                _hub = import_string(path)()
+    return _hub
+
+
+def borrow_request_event(borrow_request):
+    return {
+        "id": borrow_request.pk,
+        "book": borrow_request.book_id,
+        "user": borrow_request.user_id,
+        "borrow_date": borrow_request.borrow_date.isoformat(),
+        "return_date": borrow_request.return_date.isoformat(),
+        "status": borrow_request.status,
+    }
+
+
+def publish_borrow_requests(type, borrow_requests):
+    """
+    Publishes one `type` event ('created' or 'status_changed') per borrow request.
+    """
+    hub = get_event_hub()
+    for borrow_request in borrow_requests:
+        hub.publish(type, borrow_request_event(borrow_request))
@@ -0,0 +1,152 @@
+import contextlib
+import contextvars
+import functools
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connection, transaction
+from rest_framework import status
+from rest_framework.response import Response
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+POLL_INTERVAL = 0.05
+
+# Keys claimed inside a releasing_on_rollback() block, whose responses are only
+# stored when its transaction commits
+uncommitted_claims = contextvars.ContextVar('library_api_uncommitted_claims', default=None)
+
+
+class IdempotencyStore:
+    """
+    Idempotent requests keyed by (user id, path, key) in the
+    IDEMPOTENCY_CACHE_ALIAS cache, so every worker sharing the cache sees them.
+    The first request claims its key with cache.add(), storing the body
+    fingerprint; once processed, the response to replay is stored with it for
+    IDEMPOTENCY_TTL seconds. A claim that is never completed or released (its
+    worker died) expires after IDEMPOTENCY_PENDING_TIMEOUT seconds.
+    """
+
+    def __init__(self, alias=None, ttl=None, pending_timeout=None):
+        self.alias = alias or getattr(settings, 'IDEMPOTENCY_CACHE_ALIAS', 'default')
+        self.ttl = ttl if ttl is not None else getattr(settings, 'IDEMPOTENCY_TTL', 86400)
+        self.pending_timeout = pending_timeout or getattr(settings, 'IDEMPOTENCY_PENDING_TIMEOUT', 60)
+
+    @property
+    def cache(self):
+        return caches[self.alias]
+
+    def cache_key(self, key):
+        # Client keys may hold characters memcached does not accept
+        return 'idempotency:' + hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+    def claim(self, key, fingerprint):
+        """
+        Returns (entry, owner). The owner processes the request and must then
+        call complete() or release(); everyone else polls until the entry has a
+        response or is gone.
+        """
+        cache_key = self.cache_key(key)
+        while True:
+            entry = {"fingerprint": fingerprint, "response": None}
+            if self.cache.add(cache_key, entry, timeout=self.pending_timeout):
+                return entry, True
+            current = self.cache.get(cache_key)
+            if current is not None:
+                return current, False
+            # Released or expired in between; claim it again
+
+    def complete(self, key, fingerprint, response):
+        self.cache.set(self.cache_key(key), {"fingerprint": fingerprint, "response": response}, timeout=self.ttl)
+
+    def release(self, key):
+        # The request failed or was rolled back; let the key be retried
+        self.cache.delete(self.cache_key(key))
+
+
+idempotency_store = IdempotencyStore()
+
+
+@contextlib.contextmanager
+def releasing_on_rollback():
+    """
+    For code that runs idempotent views inside its own transaction.atomic()
+    block, entered within this one: keys they claim are released when the
+    block raises, since their responses were rolled back with it.
+    """
+    claims = []
+    token = uncommitted_claims.set(claims)
+    try:
+        yield
+    except BaseException:
+        for key in claims:
+            idempotency_store.release(key)
+        raise
+    finally:
+        uncommitted_claims.reset(token)
+
+
+def request_fingerprint(request):
+    return hashlib.sha256(json.dumps(request.data, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+def replay(entry):
+    status_code, data = entry["response"]
+    return Response(data, status=status_code, headers={'Idempotent-Replayed': 'true'})
+
+
+def idempotent(method):
+    """
+    Makes an APIView write method honour the Idempotency-Key header. A repeated
+    key with the same body gets the stored response without running the
+    method; with a different body it is rejected. Responses are stored once the
+    transaction they were produced in commits. Responses with a 5xx status are
+    not stored, so the request can be retried.
+    """
+    @functools.wraps(method)
+    def wrapper(view, request, *args, **kwargs):
+        idempotency_key = request.headers.get(HEADER)
+        if idempotency_key is None:
+            return method(view, request, *args, **kwargs)
+        if not idempotency_key or len(idempotency_key) > MAX_KEY_LENGTH:
+            return Response({"error": f"Invalid {HEADER} header."}, status=status.HTTP_400_BAD_REQUEST)
+
+        key = (request.user.pk, request.path, idempotency_key)
+        fingerprint = request_fingerprint(request)
+        deadline = time.monotonic() + getattr(settings, 'IDEMPOTENCY_WAIT', 10)
+        while True:
+            entry, owner = idempotency_store.claim(key, fingerprint)
+            if entry["fingerprint"] != fingerprint:
+                return Response({"error": f"{HEADER} was already used for a different request."},
+                                status=status.HTTP_422_UNPROCESSABLE_ENTITY)
+            if owner:
+                break
+            if entry["response"] is not None:
+                return replay(entry)
+            if time.monotonic() >= deadline:
+                return Response({"error": f"A request with this {HEADER} is still being processed."},
+                                status=status.HTTP_409_CONFLICT)
+            time.sleep(POLL_INTERVAL)
+
+        try:
+            response = method(view, request, *args, **kwargs)
+        except BaseException:
+            idempotency_store.release(key)
+            raise
+        if response.status_code >= 500:
+            idempotency_store.release(key)
+            return response
+
+        # Runs at once outside a transaction. A rolled back one drops it, and
+        # releasing_on_rollback() frees the key.
+        result = [response.status_code, response.data]
+        claims = uncommitted_claims.get()
+        if claims is not None and connection.in_atomic_block:
+            claims.append(key)
+        transaction.on_commit(lambda: idempotency_store.complete(key, fingerprint, result))
+        return response
+
+    return wrapper
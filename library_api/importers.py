@@ -0,0 +1,263 @@
+import csv
+import io
+import json
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from itertools import islice
+
+import django
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import DatabaseError, IntegrityError, connection, transaction
+from django.db.models import Q
+
+from .catalog import bump_catalog_version
+from .models import Book, User
+from .search import get_search_backend
+from .serializers import BookImportSerializer, UserProvisionSerializer
+
+logger = logging.getLogger(__name__)
+
+BOOK_UPDATE_FIELDS = ['title', 'author', 'publisher', 'publication_date']
+
+
+def iter_rows(stream, fmt):
+    """
+    Yields (row_number, row) pairs from a binary CSV, NDJSON or JSON (list) stream. CSV and NDJSON
+    are read incrementally.
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='' if fmt == 'csv' else None)
+    if fmt == 'csv':
+        for number, row in enumerate(csv.DictReader(text), start=1):
+            yield number, row
+    elif fmt == 'ndjson':
+        for number, line in enumerate(text, start=1):
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, None
+    elif fmt == 'json':
+        rows = json.load(text)
+        if not isinstance(rows, list):
+            raise ValueError("A JSON upload must be a list of objects.")
+        yield from enumerate(rows, start=1)
+    else:
+        raise ValueError(f"Unsupported format: {fmt}")
+
+
+def import_books(rows, batch_size=None):
+    """
+    Validates and upserts books (keyed on isbn) in batches. Invalid rows are reported and skipped,
+    they never abort the rest of the load.
+    """
+    batch_size = batch_size or getattr(settings, 'BOOK_IMPORT_BATCH_SIZE', 1000)
+    report = {"imported": 0, "failed": 0, "errors": []}
+    rows = iter(rows)
+
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        # Keyed on isbn so a repeated isbn within one batch keeps the last row;
+        # the rows it replaces are reported
+        books = {}
+        for number, row in batch:
+            if not isinstance(row, dict):
+                report["errors"].append({"row": number, "errors": {"non_field_errors": ["Malformed row."]}})
+                continue
+            serializer = BookImportSerializer(data=row)
+            if not serializer.is_valid():
+                report["errors"].append({"row": number, "errors": serializer.errors})
+                continue
+            isbn = serializer.validated_data['isbn']
+            if isbn in books:
+                report["errors"].append({"row": books[isbn][0], "errors": {
+                    "isbn": [f"Superseded by row {number} with the same ISBN."]
+                }})
+            books[isbn] = (number, Book(**serializer.validated_data))
+
+        if books:
+            try:
+                with transaction.atomic():
+                    upsert_books([book for _, book in books.values()])
+                report["imported"] += len(books)
+            except DatabaseError as e:
+                for number, _ in books.values():
+                    report["errors"].append({"row": number, "errors": {"non_field_errors": [str(e)]}})
+
+    # bulk_create sends no post_save, so invalidate the catalog caches here
+    if report["imported"]:
+        bump_catalog_version()
+        get_search_backend().invalidate()
+
+    report["failed"] = len(report["errors"])
+    report["errors"].sort(key=lambda error: error["row"])
+    return report
+
+
+def upsert_books(books):
+    options = {"update_conflicts": True, "update_fields": BOOK_UPDATE_FIELDS}
+    # MySQL's ON DUPLICATE KEY UPDATE does not take a conflict target
+    if connection.features.supports_update_conflicts_with_target:
+        options["unique_fields"] = ['isbn']
+    return Book.objects.bulk_create(books, **options)
+
+
+def hashing_pool(workers, start_method=None):
+    """
+    Process pool for hash_passwords, or None for a single worker. Processes
+    start on first use.
+    """
+    if workers == 1:
+        return None
+    context = multiprocessing.get_context(start_method) if start_method else None
+    # Spawned workers start without configured settings; in forked ones setup is a no-op
+    return ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=django.setup)
+
+
+_hashing_pool = None
+_hashing_pool_lock = threading.Lock()
+
+
+def shared_hashing_pool():
+    """
+    The hashing pool of this server process, kept for every request: starting
+    one costs more than hashing a typical upload. Its processes are spawned,
+    since forking a multi-threaded server process would copy locks held by its
+    other threads.
+    """
+    global _hashing_pool
+    workers = hashing_workers()
+    if workers == 1:
+        return None
+    if _hashing_pool is None:
+        with _hashing_pool_lock:
+            if _hashing_pool is None:
+                _hashing_pool = hashing_pool(workers, 'spawn')
+    return _hashing_pool
+
+
+def hashing_workers(workers=None):
+    return workers or getattr(settings, 'USER_PROVISION_WORKERS', None) or os.cpu_count() or 1
+
+
+def hash_passwords(passwords, pool=None, workers=1):
+    """
+    Hashes passwords on a process pool so the key derivation uses every core.
+    Fewer than USER_PROVISION_PARALLEL_MIN are hashed in process, where they
+    finish before the pool would have them all.
+    """
+    if pool is None or len(passwords) < getattr(settings, 'USER_PROVISION_PARALLEL_MIN', 64):
+        return [make_password(password) for password in passwords]
+    try:
+        return list(pool.map(make_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+    except BrokenProcessPool:
+        # A worker died; the pool refuses all further work
+        logger.exception("Password hashing pool broke; hashing in process")
+        discard_shared_hashing_pool(pool)
+        return [make_password(password) for password in passwords]
+
+
+def discard_shared_hashing_pool(pool):
+    global _hashing_pool
+    with _hashing_pool_lock:
+        if _hashing_pool is pool:
+            _hashing_pool = None
+
+
+def provision_users(rows, batch_size=None, workers=None, shared_pool=False):
+    """
+    Validates and creates users in batches. Username/email collisions are found with one query per
+    batch, passwords are hashed in parallel and users are inserted with bulk_create. Every batch
+    hashes on the same process pool: this process's shared_hashing_pool() with `shared_pool`, as
+    web requests do, or else one started for this call. Returns one result per row.
+    """
+    batch_size = batch_size or getattr(settings, 'USER_PROVISION_BATCH_SIZE', 1000)
+    if shared_pool:
+        pool, workers = shared_hashing_pool(), hashing_workers()
+        results = provision_batches(iter(rows), batch_size, pool, workers)
+    else:
+        workers = hashing_workers(workers)
+        pool = hashing_pool(workers)
+        try:
+            results = provision_batches(iter(rows), batch_size, pool, workers)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+    results.sort(key=lambda result: result["row"])
+    return results
+
+
+def provision_batches(rows, batch_size, pool, workers):
+    results = []
+    while True:
+        batch = list(islice(rows, batch_size))
+        if not batch:
+            break
+
+        valid = []
+        for number, row in batch:
+            if not isinstance(row, dict):
+                results.append({"row": number, "status": "error", "errors": {"non_field_errors": ["Malformed row."]}})
+                continue
+            serializer = UserProvisionSerializer(data=row)
+            if serializer.is_valid():
+                data = dict(serializer.validated_data)
+                data['email'] = User.objects.normalize_email(data['email'])
+                valid.append((number, data))
+            else:
+                results.append({"row": number, "status": "error", "errors": serializer.errors})
+
+        # One set-based query for collisions with existing users, then within the batch
+        taken = User.objects.filter(
+            Q(username__in=[data['username'] for _, data in valid]) | Q(email__in=[data['email'] for _, data in valid])
+        ).values_list('username', 'email')
+        taken_usernames = {username for username, _ in taken}
+        taken_emails = {email for _, email in taken}
+
+        accepted = []
+        for number, data in valid:
+            errors = {}
+            if data['username'] in taken_usernames:
+                errors['username'] = ["A user with that username already exists."]
+            if data['email'] in taken_emails:
+                errors['email'] = ["Email already exists"]
+            if errors:
+                results.append({"row": number, "status": "error", "username": data['username'], "errors": errors})
+                continue
+            taken_usernames.add(data['username'])
+            taken_emails.add(data['email'])
+            accepted.append((number, data))
+
+        hashes = hash_passwords([data.pop('password') for _, data in accepted], pool, workers)
+        users = [User(password=password_hash, **data) for (_, data), password_hash in zip(accepted, hashes)]
+        results.extend(insert_users(accepted, users))
+    return results
+
+
+def insert_users(accepted, users):
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create(users)
+        return [{"row": number, "status": "created", "username": user.username} for (number, _), user in zip(accepted, users)]
+    except IntegrityError:
+        pass
+
+    # A concurrent insert took one of the names; fall back to row by row for this batch
+    results = []
+    for (number, _), user in zip(accepted, users):
+        try:
+            with transaction.atomic():
+                user.save(force_insert=True)
+            results.append({"row": number, "status": "created", "username": user.username})
+        except IntegrityError:
+            results.append({"row": number, "status": "error", "username": user.username,
+                            "errors": {"non_field_errors": ["Username or email already exists."]}})
+    return results
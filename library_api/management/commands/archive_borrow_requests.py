@@ -0,0 +1,42 @@
+import datetime
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library_api.models import BorrowRequest
+from library_api.services import archive_borrow_requests
+
+
+class Command(BaseCommand):
+    help = ("Move returned and denied borrow requests whose return date is more than --days days old "
+            "to the archive table, in batches. Safe to interrupt and re-run.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=None,
+                            help="Archive requests returned more than this many days ago.")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--max-batches', type=int, default=None, help="Stop after this many batches.")
+        parser.add_argument('--dry-run', action='store_true', help="Only count the requests that would be moved.")
+
+    def handle(self, *args, **options):
+        days = options['days'] if options['days'] is not None else getattr(settings, 'BORROW_ARCHIVE_AFTER_DAYS', 365)
+        batch_size = options['batch_size'] or getattr(settings, 'BORROW_ARCHIVE_BATCH_SIZE', 1000)
+        if days < 0 or batch_size < 1:
+            raise CommandError("--days must be >= 0 and --batch-size >= 1.")
+        cutoff = timezone.localdate() - datetime.timedelta(days=days)
+
+        if options['dry_run']:
+            count = BorrowRequest.objects.filter(status__in=['returned', 'denied'], return_date__lt=cutoff).count()
+            self.stdout.write(f"{count} borrow requests returned before {cutoff} would be archived.")
+            return
+
+        moved = batches = 0
+        while options['max_batches'] is None or batches < options['max_batches']:
+            count = archive_borrow_requests(cutoff, batch_size)
+            if not count:
+                break
+            moved += count
+            batches += 1
+            self.stdout.write(f"batch {batches}: {count} archived ({moved} total)")
+        self.stdout.write(self.style.SUCCESS(f"Archived {moved} borrow requests returned before {cutoff}."))
@@ -0,0 +1,57 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from library_api.models import Book, BorrowRequest, User
+from library_api.services import BorrowConflictChecker
+
+
+class Command(BaseCommand):
+    help = "Benchmark borrow conflict checks as the approved history of a book grows (runs in a rolled back transaction)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='1000,10000,100000,1000000',
+                            help="Comma separated history sizes to measure.")
+        parser.add_argument('--checks', type=int, default=2000, help="Conflict checks per measurement.")
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        sizes = sorted(int(size) for size in options['sizes'].split(','))
+        with transaction.atomic():
+            self.run(sizes, options['checks'], options['batch_size'])
+            transaction.set_rollback(True)
+
+    def run(self, sizes, checks, batch_size):
+        user = User.objects.create_user('bench-conflicts', 'bench-conflicts@example.com', 'unused')
+        book = Book.objects.create(title='Bench', author='Bench', publisher='Bench',
+                                   publication_date=datetime.date(2000, 1, 1), isbn='9999999999999')
+        start = datetime.date(1900, 1, 1)
+        checker = BorrowConflictChecker()
+        created = 0
+
+        self.stdout.write(f"{'rows':>10} {'indexed query (us)':>20} {'cached bisect (us)':>20}")
+        for size in sizes:
+            while created < size:
+                count = min(batch_size, size - created)
+                BorrowRequest.objects.bulk_create(
+                    BorrowRequest(user=user, book=book, status='approved',
+                                  borrow_date=start + datetime.timedelta(days=2 * i),
+                                  return_date=start + datetime.timedelta(days=2 * i + 1))
+                    for i in range(created, created + count)
+                )
+                created += count
+            checker.invalidate()
+
+            probes = [start + datetime.timedelta(days=(i * 7919) % (2 * size)) for i in range(checks)]
+            query_time = self.measure(lambda day: checker.query_conflict(book.pk, day, day + datetime.timedelta(days=1)), probes)
+            checker.has_conflict(book, start, start)  # warm the cache outside the timed loop
+            cached_time = self.measure(lambda day: checker.has_conflict(book, day, day + datetime.timedelta(days=1)), probes)
+            self.stdout.write(f"{size:>10} {query_time:>20.1f} {cached_time:>20.1f}")
+
+    def measure(self, check, probes):
+        began = time.perf_counter()
+        for day in probes:
+            check(day)
+        return (time.perf_counter() - began) / len(probes) * 1e6
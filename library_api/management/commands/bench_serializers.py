@@ -0,0 +1,65 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from rest_framework.renderers import JSONRenderer
+
+from library_api.models import Book, BorrowRequest, User
+from library_api.renderers import FastJSONRenderer
+from library_api.serializers import (BookSerializer, BorrowRequestSerializer, book_list_serializer,
+                                     borrow_request_list_serializer)
+
+
+class Command(BaseCommand):
+    help = ("Compare ModelSerializer + JSONRenderer against the values_list() fast path + FastJSONRenderer "
+            "for the list endpoints (runs in a rolled back transaction).")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=10000)
+        parser.add_argument('--repeat', type=int, default=5)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            self.run(options['rows'], options['repeat'])
+            transaction.set_rollback(True)
+
+    def run(self, rows, repeat):
+        user = User.objects.create_user('bench-serializers', 'bench-serializers@example.com', 'unused')
+        Book.objects.bulk_create(
+            Book(title=f'Title {i}', author=f'Author {i}', publisher='Publisher', isbn=f'97{i:011d}',
+                 publication_date=datetime.date(2000, 1, 1) + datetime.timedelta(days=i % 9000))
+            for i in range(rows)
+        )
+        books = Book.objects.filter(isbn__startswith='97').order_by('id')
+        book = books.first()
+        BorrowRequest.objects.bulk_create(
+            BorrowRequest(user=user, book=book, borrow_date=datetime.date(2000, 1, 1) + datetime.timedelta(days=2 * i),
+                          return_date=datetime.date(2000, 1, 2) + datetime.timedelta(days=2 * i))
+            for i in range(rows)
+        )
+        borrow_requests = BorrowRequest.objects.filter(user=user).order_by('id')
+
+        self.stdout.write(f"{rows} rows, best of {repeat} (ms per 10k rows)")
+        for name, queryset, serializer_class, fast in (
+            ('books', books, BookSerializer, book_list_serializer),
+            ('borrow requests', borrow_requests, BorrowRequestSerializer, borrow_request_list_serializer),
+        ):
+            slow_out, slow_time = self.measure(
+                lambda: JSONRenderer().render(serializer_class(queryset.all(), many=True).data), repeat)
+            fast_out, fast_time = self.measure(
+                lambda: FastJSONRenderer().render(fast.serialize(fast.values(queryset.all()))), repeat)
+            if slow_out != fast_out:
+                raise CommandError(f"Fast path output differs from {serializer_class.__name__} for {name}.")
+            scale = 10000 / rows * 1000
+            self.stdout.write(f"{name:>16}: ModelSerializer {slow_time * scale:8.1f}  fast path {fast_time * scale:8.1f}  "
+                              f"speedup {slow_time / fast_time:.1f}x  (identical output)")
+
+    def measure(self, build, repeat):
+        best, output = None, None
+        for _ in range(repeat):
+            started = time.perf_counter()
+            output = build()
+            elapsed = time.perf_counter() - started
+            best = elapsed if best is None else min(best, elapsed)
+        return output, best
@@ -0,0 +1,55 @@
+import datetime
+import json
+import random
+import threading
+
+from .loadbench import Command as LoadBenchCommand
+
+READ_SCENARIOS = 'catalog,personal_history,user_history'
+
+
+class Command(LoadBenchCommand):
+    help = ("Compare a WSGI and an ASGI deployment of the same database on the read-heavy endpoints at "
+            "increasing numbers of concurrent connections, e.g. gunicorn library_management.wsgi versus "
+            "uvicorn library_management.asgi:application. Expects data from generate_library_data.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8001')
+        parser.add_argument('--connections', default='8,32,128,256', help="Comma separated concurrency levels.")
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per scenario and level.")
+        parser.add_argument('--scenarios', default=READ_SCENARIOS)
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--output', default='deployment_comparison.json')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.rng_lock = threading.Lock()
+        scenarios = self.parse_scenarios(options['scenarios'])
+        levels = [int(level) for level in options['connections'].split(',')]
+        self.prepare(options['users'])
+
+        results = {}
+        for deployment in ('wsgi', 'asgi'):
+            self.base_url = options[f'{deployment}_url'].rstrip('/')
+            results[deployment] = {}
+            for level in levels:
+                results[deployment][level] = {}
+                for name in scenarios:
+                    summary = self.run_scenario(name, options['requests'], level)
+                    results[deployment][level][name] = summary
+                    self.stdout.write(f"{deployment} {level:>4} conns {name:>18}: {summary['throughput_rps']:8.1f} req/s  "
+                                      f"p99 {summary['p99_ms']}ms  errors {summary['errors']}")
+
+        report = {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": self.git_commit(),
+            "wsgi_url": options['wsgi_url'],
+            "asgi_url": options['asgi_url'],
+            "requests_per_scenario": options['requests'],
+            "results": results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
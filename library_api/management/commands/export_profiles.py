@@ -0,0 +1,45 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library_api.profiling import ProfileStore, to_collapsed, to_speedscope
+
+
+class Command(BaseCommand):
+    help = ("List the stored request profiles, or export one as collapsed stacks (flamegraph.pl) "
+            "or speedscope JSON. Captures are named by the X-Profile-Id response header.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('capture_id', nargs='?', help="Capture to export (default: the latest).")
+        parser.add_argument('--list', action='store_true', help="List the stored captures instead.")
+        parser.add_argument('--format', choices=('collapsed', 'speedscope', 'json'), default='speedscope',
+                            help="'json' writes the capture itself, with the SQL trace.")
+        parser.add_argument('--output', default=None, help="Write to this path instead of stdout.")
+
+    def handle(self, *args, **options):
+        store = ProfileStore()
+        ids = store.ids()
+        if options['list']:
+            for capture_id in ids:
+                capture = store.load(capture_id)
+                self.stdout.write(f"{capture_id}  {capture['duration'] * 1000:8.1f} ms  {len(capture['queries']):4} queries  "
+                                  f"{capture['status']} {capture['method']} {capture['path']}")
+            return
+
+        capture_id = options['capture_id'] or (ids[-1] if ids else None)
+        if capture_id not in ids:
+            raise CommandError(f"No stored profile {capture_id} in {store.directory}.")
+        capture = store.load(capture_id)
+        if options['format'] == 'collapsed':
+            content = to_collapsed(capture)
+        elif options['format'] == 'speedscope':
+            content = json.dumps(to_speedscope(capture))
+        else:
+            content = json.dumps(capture, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(content)
+            self.stdout.write(self.style.SUCCESS(f"Profile {capture_id} written to {options['output']}"))
+        else:
+            self.stdout.write(content, ending='')
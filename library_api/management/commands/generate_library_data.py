@@ -0,0 +1,99 @@
+import datetime
+import random
+import time
+from collections import defaultdict
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library_api.models import Book, BookInstance, BorrowRequest, User
+
+BENCH_PASSWORD = 'Bench@1234'
+
+
+class Command(BaseCommand):
+    help = ("Fill the database with a synthetic, reproducible library dataset for benchmarking. "
+            f"All generated users share the password {BENCH_PASSWORD!r}; 'bench-librarian' is a staff user.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=10000)
+        parser.add_argument('--instances', type=int, default=50000, help="Total BookInstance rows.")
+        parser.add_argument('--requests', type=int, default=200000, help="Total BorrowRequest rows.")
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--batch-size', type=int, default=10000)
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username='bench-librarian').exists():
+            raise CommandError("Benchmark data already present; generate into a fresh database.")
+
+        self.rng = random.Random(options['seed'])
+        self.batch_size = options['batch_size']
+        books, instances, requests, users = (options[name] for name in ('books', 'instances', 'requests', 'users'))
+        if books < 1 or users < 1:
+            raise CommandError("--books and --users must be at least 1.")
+        if instances < books:
+            raise CommandError("--instances must be at least --books, so every book has a copy to lend.")
+
+        password = make_password(BENCH_PASSWORD)
+        User.objects.create(username='bench-librarian', email='bench-librarian@example.com',
+                            password=password, role='admin', is_staff=True)
+        self.insert(User, users, lambda i: User(
+            username=f'bench-user-{i}', email=f'bench-user-{i}@example.com', password=password))
+        # Primary keys are read back: they need not be contiguous (auto_increment_increment,
+        # sequence caches, existing rows)
+        user_pks = dict(User.objects.filter(username__startswith='bench-user-').values_list('username', 'pk'))
+        user_ids = [user_pks[f'bench-user-{i}'] for i in range(users)]
+
+        epoch = datetime.date(1950, 1, 1)
+        self.insert(Book, books, lambda i: Book(
+            title=f'Title {i} {self.word()} {self.word()}',
+            author=f'{self.word().title()} {self.word().title()}',
+            publisher=f'{self.word().title()} Press',
+            publication_date=epoch + datetime.timedelta(days=self.rng.randrange(27000)),
+            isbn=f'978{i:010d}',
+            copies=instances // books + (1 if i < instances % books else 0),
+        ))
+        # Zero-padded, so ISBN order is generation order
+        book_ids = list(Book.objects.filter(isbn__gte=f'978{0:010d}', isbn__lte=f'978{books - 1:010d}')
+                        .order_by('isbn').values_list('pk', flat=True))
+
+        self.insert(BookInstance, instances, lambda i: BookInstance(book_id=book_ids[i % books]))
+        copy_ids = defaultdict(list)
+        for book_id, copy_id in BookInstance.objects.filter(book_id__in=book_ids).order_by('id').values_list('book_id', 'id'):
+            copy_ids[book_id].append(copy_id)
+
+        # Request i is slot i // books of book i % books; slots never overlap, so
+        # (book, borrow_date, return_date) stays unique and any copy of the book
+        # can hold an approved one. Loans already over are returned.
+        start = datetime.date(2000, 1, 1)
+        today = timezone.localdate()
+
+        def borrow_request(i):
+            book_id, slot = book_ids[i % books], i // books
+            borrow_request = BorrowRequest(
+                user_id=user_ids[self.rng.randrange(users)],
+                book_id=book_id,
+                borrow_date=start + datetime.timedelta(days=14 * slot),
+                return_date=start + datetime.timedelta(days=14 * slot + 7),
+                status=self.rng.choices(['approved', 'denied', 'pending'], weights=[70, 20, 10])[0],
+            )
+            if borrow_request.status == 'approved':
+                copies = copy_ids[book_id]
+                borrow_request.book_instance_id = copies[slot % len(copies)]
+                if borrow_request.return_date < today:
+                    borrow_request.status = 'returned'
+            return borrow_request
+
+        self.insert(BorrowRequest, requests, borrow_request)
+
+    def insert(self, model, total, build):
+        started = time.perf_counter()
+        for offset in range(0, total, self.batch_size):
+            model.objects.bulk_create([build(i) for i in range(offset, min(offset + self.batch_size, total))])
+            self.stdout.write(f"\r{model.__name__}: {min(offset + self.batch_size, total)}/{total}", ending='')
+        self.stdout.write(f"\r{model.__name__}: {total} rows in {time.perf_counter() - started:.1f}s")
+
+    def word(self):
+        return ''.join(self.rng.choice('abcdefghijklmnopqrstuvwxyz') for _ in range(self.rng.randint(3, 9)))
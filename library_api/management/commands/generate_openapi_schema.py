@@ -0,0 +1,19 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from library_api.schema import generate_schema
+
+
+class Command(BaseCommand):
+    help = ("Generate the OpenAPI document for all API views and write it to OPENAPI_SCHEMA_PATH. "
+            "Run at build time; the swagger route serves this file instead of introspecting views per request.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None, help="Defaults to settings.OPENAPI_SCHEMA_PATH.")
+
+    def handle(self, *args, **options):
+        path = options['output'] or settings.OPENAPI_SCHEMA_PATH
+        schema = generate_schema()
+        with open(path, 'wb') as output:
+            output.write(schema)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {len(schema)} bytes of OpenAPI schema to {path}"))
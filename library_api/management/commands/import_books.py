@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library_api.importers import iter_rows, import_books
+
+
+class Command(BaseCommand):
+    help = "Bulk import books from a CSV or NDJSON file, upserting on isbn."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson'],
+                            help="Input format (defaults to the file extension, else csv).")
+        parser.add_argument('--batch-size', type=int, default=None)
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'csv')
+
+        try:
+            with open(path, 'rb') as stream:
+                report = import_books(iter_rows(stream, fmt), batch_size=options['batch_size'])
+        except OSError as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+        for error in report["errors"]:
+            self.stderr.write(f"row {error['row']}: {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(f"Imported {report['imported']} books, {report['failed']} rows failed."))
@@ -0,0 +1,69 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand, CommandError
+
+# What a worker imports before serving its first request: the application
+# module and, since Django loads it lazily, the root urlconf with every view
+BOOT_SCRIPTS = {
+    'wsgi': "import library_management.wsgi\nfrom django.urls import get_resolver\nget_resolver().url_patterns\n",
+    'asgi': "import library_management.asgi\nfrom django.conf import settings\nfrom django.urls import get_resolver\n"
+            "get_resolver(getattr(settings, 'ASGI_URLCONF', None)).url_patterns\n",
+}
+
+
+class Command(BaseCommand):
+    help = ("Boot the WSGI or ASGI application in a fresh interpreter under `python -X importtime` "
+            "and report the import cost per module and per top-level package.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', choices=sorted(BOOT_SCRIPTS), default='wsgi')
+        parser.add_argument('--limit', type=int, default=25, help="Rows to print per table.")
+        parser.add_argument('--output', default=None, help="Also write the full report as JSON to this path.")
+
+    def handle(self, *args, **options):
+        env = dict(os.environ)
+        env.setdefault('DJANGO_SETTINGS_MODULE', 'library_management.settings')
+        result = subprocess.run([sys.executable, '-X', 'importtime', '-c', BOOT_SCRIPTS[options['target']]],
+                                capture_output=True, text=True, env=env)
+        if result.returncode:
+            raise CommandError(f"Booting {options['target']} failed:\n{result.stderr[-2000:]}")
+
+        modules = self.parse(result.stderr)
+        packages = defaultdict(int)
+        for module in modules:
+            packages[module['module'].split('.')[0]] += module['self_us']
+        total = sum(packages.values())
+
+        self.stdout.write(f"{options['target']}: {len(modules)} modules imported in {total / 1000:.1f} ms\n")
+        self.stdout.write(f"{'self ms':>9} {'share':>6}  package")
+        for package, self_us in sorted(packages.items(), key=lambda item: -item[1])[:options['limit']]:
+            self.stdout.write(f"{self_us / 1000:9.1f} {self_us / total:6.1%}  {package}")
+        self.stdout.write(f"\n{'cumul ms':>9} {'self ms':>9}  module")
+        for module in sorted(modules, key=lambda m: -m['cumulative_us'])[:options['limit']]:
+            self.stdout.write(f"{module['cumulative_us'] / 1000:9.1f} {module['self_us'] / 1000:9.1f}  {module['module']}")
+
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump({"target": options['target'], "total_us": total, "packages": dict(packages),
+                           "modules": modules}, output, indent=2)
+            self.stdout.write(self.style.SUCCESS(f"Report written to {options['output']}"))
+
+    def parse(self, stderr):
+        # Lines look like "import time:  self [us] | cumulative | imported package"
+        modules = []
+        for line in stderr.splitlines():
+            if not line.startswith('import time:'):
+                continue
+            fields = line[len('import time:'):].split('|')
+            if len(fields) != 3 or not fields[0].strip().isdigit():
+                continue
+            modules.append({
+                "module": fields[2].strip(),
+                "self_us": int(fields[0]),
+                "cumulative_us": int(fields[1]),
+            })
+        return modules
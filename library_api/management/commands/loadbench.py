@@ -0,0 +1,187 @@
+import datetime
+import itertools
+import json
+import platform
+import random
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework_simplejwt.tokens import AccessToken
+
+from library_api.models import Book, User
+from .generate_library_data import BENCH_PASSWORD
+
+SCENARIOS = ['token', 'catalog', 'borrow_create', 'borrow_approve', 'personal_history', 'user_history', 'csv_download']
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+class Command(BaseCommand):
+    help = ("Drive the API of a running server with concurrent clients and report p50/p95/p99 latency "
+            "and throughput per endpoint. Expects data from generate_library_data and must share the "
+            "server's settings, since access tokens are minted locally. The token scenario goes through "
+            "the anonymous throttle, so raise DEFAULT_THROTTLE_RATES['anon'] when benchmarking it.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000')
+        parser.add_argument('--concurrency', type=int, default=16)
+        parser.add_argument('--requests', type=int, default=500, help="Requests per scenario.")
+        parser.add_argument('--scenarios', default=','.join(SCENARIOS))
+        parser.add_argument('--users', type=int, default=1000, help="Number of generated bench users to pick from.")
+        parser.add_argument('--token-user', default='bench-user-0', help="User whose credentials the token scenario posts.")
+        parser.add_argument('--output', default='bench_results.json')
+        parser.add_argument('--seed', type=int, default=42)
+
+    def handle(self, *args, **options):
+        self.base_url = options['base_url'].rstrip('/')
+        self.rng = random.Random(options['seed'])
+        self.rng_lock = threading.Lock()
+        self.token_user = options['token_user']
+        scenarios = self.parse_scenarios(options['scenarios'])
+        self.prepare(options['users'])
+
+        results = {}
+        for name in scenarios:
+            results[name] = self.run_scenario(name, options['requests'], options['concurrency'])
+            summary = results[name]
+            self.stdout.write(f"{name:>18}: {summary['throughput_rps']:8.1f} req/s  p50 {summary['p50_ms']}ms  "
+                              f"p95 {summary['p95_ms']}ms  p99 {summary['p99_ms']}ms  errors {summary['errors']}")
+
+        report = {
+            "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            "commit": self.git_commit(),
+            "python": platform.python_version(),
+            "base_url": self.base_url,
+            "concurrency": options['concurrency'],
+            "requests_per_scenario": options['requests'],
+            "results": results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+    def parse_scenarios(self, value):
+        scenarios = [name for name in value.split(',') if name]
+        unknown = set(scenarios) - set(SCENARIOS)
+        if unknown:
+            raise CommandError(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+        return scenarios
+
+    def prepare(self, user_count):
+        users = {user.username: user for user in User.objects.filter(username__startswith='bench-')[:user_count + 1]}
+        if 'bench-librarian' not in users or len(users) < 2:
+            raise CommandError("No benchmark users found; run generate_library_data first.")
+        self.librarian = str(AccessToken.for_user(users.pop('bench-librarian')))
+        self.user_ids = sorted(user.pk for user in users.values())
+        self.user_tokens = [(user.pk, str(AccessToken.for_user(user))) for user in list(users.values())[:20]]
+        self.book_ids = list(Book.objects.order_by('id').values_list('id', flat=True)[:50])
+        self.created_ids = []
+        self.slot = itertools.count()
+
+    def run_scenario(self, name, count, concurrency):
+        call = getattr(self, f'scenario_{name}')
+        latencies, errors = [], 0
+        lock = threading.Lock()
+
+        def one(i):
+            nonlocal errors
+            started = time.perf_counter()
+            try:
+                ok = call(i)
+            except (urllib.error.URLError, OSError):
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors += 1
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one, range(count)))
+        wall = time.perf_counter() - started
+
+        latencies.sort()
+        return {
+            "requests": count,
+            "errors": errors,
+            "throughput_rps": round(count / wall, 2) if wall else None,
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+
+    def request(self, method, path, token=None, body=None):
+        data = json.dumps(body).encode('utf-8') if body is not None else None
+        req = urllib.request.Request(self.base_url + path, data=data, method=method)
+        req.add_header('Content-Type', 'application/json')
+        if token:
+            req.add_header('Authorization', f'Bearer {token}')
+        try:
+            with urllib.request.urlopen(req, timeout=60) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read()
+
+    def random_user_token(self):
+        with self.rng_lock:
+            return self.rng.choice(self.user_tokens)
+
+    def scenario_token(self, i):
+        code, _ = self.request('POST', '/api/token/', body={'username': self.token_user, 'password': BENCH_PASSWORD})
+        return code == 200
+
+    def scenario_catalog(self, i):
+        code, _ = self.request('GET', '/api/user/books/?page_size=50', token=self.random_user_token()[1])
+        return code == 200
+
+    def scenario_borrow_create(self, i):
+        # Far future dates so new requests never collide with generated history
+        day = datetime.date(9000, 1, 1) + datetime.timedelta(days=2 * next(self.slot))
+        user_id, token = self.random_user_token()
+        body = {'book': self.book_ids[i % len(self.book_ids)], 'user': user_id, 'borrow_date': day.isoformat(),
+                'return_date': (day + datetime.timedelta(days=1)).isoformat()}
+        code, response = self.request('POST', '/api/user/books/', token=token, body=body)
+        if code == 201:
+            with self.rng_lock:
+                self.created_ids.append(json.loads(response)['id'])
+        return code == 201
+
+    def scenario_borrow_approve(self, i):
+        with self.rng_lock:
+            pk = self.created_ids.pop() if self.created_ids else None
+        if pk is None:
+            return False
+        code, _ = self.request('PUT', f'/api/librarian/borrow-requests/{pk}/', token=self.librarian,
+                               body={'status': 'approved'})
+        return code in (200, 409)
+
+    def scenario_personal_history(self, i):
+        code, _ = self.request('GET', '/api/user/borrow-history/', token=self.random_user_token()[1])
+        return code == 200
+
+    def scenario_user_history(self, i):
+        with self.rng_lock:
+            user_id = self.rng.choice(self.user_ids)
+        code, _ = self.request('GET', f'/api/librarian/user-history/{user_id}/', token=self.librarian)
+        return code == 200
+
+    def scenario_csv_download(self, i):
+        code, _ = self.request('GET', '/api/user/download-history/', token=self.random_user_token()[1])
+        return code in (200, 404)
+
+    def git_commit(self):
+        try:
+            return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from library_api.importers import iter_rows, provision_users
+
+
+class Command(BaseCommand):
+    help = "Bulk create users from a CSV, NDJSON or JSON file (username, email, password, role)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'ndjson', 'json'],
+                            help="Input format (defaults to the file extension, else csv).")
+        parser.add_argument('--batch-size', type=int, default=None)
+        parser.add_argument('--workers', type=int, default=None, help="Password hashing processes.")
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or (
+            'ndjson' if path.endswith(('.ndjson', '.jsonl')) else 'json' if path.endswith('.json') else 'csv')
+
+        try:
+            with open(path, 'rb') as stream:
+                results = provision_users(iter_rows(stream, fmt), batch_size=options['batch_size'],
+                                          workers=options['workers'])
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read {path}: {e}")
+
+        created = 0
+        for result in results:
+            if result["status"] == "created":
+                created += 1
+            else:
+                self.stderr.write(f"row {result['row']}: {result['errors']}")
+        self.stdout.write(self.style.SUCCESS(f"Created {created} users, {len(results) - created} rows failed."))
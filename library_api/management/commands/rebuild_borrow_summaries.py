@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from library_api.models import User
+from library_api.summaries import rebuild_summaries
+
+
+class Command(BaseCommand):
+    help = ("Recompute the per-user borrowing summaries from the borrow request and archive tables, "
+            "creating missing ones. Use after bulk loads or to repair drift.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', type=int, action='append', dest='users',
+                            help="Only rebuild this user id (repeatable).")
+        parser.add_argument('--batch-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        user_ids = User.objects.order_by('id').values_list('id', flat=True)
+        if options['users']:
+            user_ids = user_ids.filter(id__in=options['users'])
+
+        rebuilt, batch = 0, []
+        for user_id in user_ids.iterator(chunk_size=options['batch_size']):
+            batch.append(user_id)
+            if len(batch) == options['batch_size']:
+                rebuilt += rebuild_summaries(batch)
+                batch = []
+        if batch:
+            rebuilt += rebuild_summaries(batch)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} borrowing summaries."))
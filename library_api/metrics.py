@@ -0,0 +1,218 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import HttpResponse, HttpResponseForbidden
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+# Per-request counters, set by RequestMetricsMiddleware
+current_stats = contextvars.ContextVar('library_api_request_stats', default=None)
+
+
+class RequestStats:
+    __slots__ = ('queries', 'db_time', 'serializer_time', 'serializer_depth')
+
+    def __init__(self):
+        self.queries = 0
+        self.db_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+        series[0][bisect.bisect_left(self.buckets, value)] += 1
+        series[1] += value
+        series[2] += 1
+
+    def render(self, label_names):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} histogram']
+        for labels, (counts, total, count) in sorted(self.series.items()):
+            base = format_labels(label_names, labels)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{base}}} {total}')
+            lines.append(f'{self.name}_count{{{base}}} {count}')
+        return lines
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help_text = help_text
+        self.series = {}
+
+    def inc(self, labels, value=1):
+        self.series[labels] = self.series.get(labels, 0) + value
+
+    def render(self, label_names):
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{{{format_labels(label_names, labels)}}} {value}')
+        return lines
+
+
+def format_labels(names, values):
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{name}="{escape(value)}"' for name, value in zip(names, values))
+
+
+class MetricsRegistry:
+    label_names = ('route', 'method', 'status')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latency = Histogram('library_api_request_duration_seconds', 'Request latency in seconds.', LATENCY_BUCKETS)
+        self.queries = Histogram('library_api_request_db_queries', 'SQL queries issued per request.', QUERY_BUCKETS)
+        self.db_time = Histogram('library_api_request_db_seconds', 'Time spent in SQL per request.', LATENCY_BUCKETS)
+        self.serializer_time = Histogram('library_api_request_serializer_seconds',
+                                         'Time spent serializing per request.', LATENCY_BUCKETS)
+        self.response_size = Histogram('library_api_response_size_bytes', 'Response body size in bytes.', SIZE_BUCKETS)
+        self.query_alerts = Counter('library_api_requests_over_query_threshold_total',
+                                    'Requests that issued more SQL queries than METRICS_QUERY_THRESHOLD.')
+
+    def record(self, labels, duration, stats, size):
+        with self._lock:
+            self.latency.observe(labels, duration)
+            self.queries.observe(labels, stats.queries)
+            self.db_time.observe(labels, stats.db_time)
+            self.serializer_time.observe(labels, stats.serializer_time)
+            if size is not None:
+                self.response_size.observe(labels, size)
+
+    def record_query_alert(self, labels):
+        with self._lock:
+            self.query_alerts.inc(labels)
+
+    def render(self):
+        with self._lock:
+            lines = []
+            for metric in (self.latency, self.queries, self.db_time, self.serializer_time,
+                           self.response_size, self.query_alerts):
+                lines.extend(metric.render(self.label_names))
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry()
+
+
+# Counts queries for whichever request is current in the calling context. The
+# context variable follows the request into sync_to_async worker threads, so
+# queries made by async ORM calls are counted as well.
+def count_query(execute, sql, params, many, context):
+    stats = current_stats.get()
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        if stats is not None:
+            stats.queries += 1
+            stats.db_time += time.perf_counter() - started
+
+
+@receiver(connection_created)
+def install_query_counter(sender, connection, **kwargs):
+    if count_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(count_query)
+
+
+class RequestMetricsMiddleware:
+    """
+    Records latency, SQL query count and time, serializer time and response size
+    per route. Queries run while a streaming response is consumed happen after
+    the middleware returns and are not counted. Works under WSGI and ASGI.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.query_threshold = getattr(settings, 'METRICS_QUERY_THRESHOLD', 50)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        for conn in connections.all(initialized_only=True):
+            install_query_counter(sender=None, connection=conn)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, stats, started)
+        return response
+
+    async def __acall__(self, request):
+        stats = RequestStats()
+        token = current_stats.set(stats)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_stats.reset(token)
+        self.record(request, response, stats, started)
+        return response
+
+    def record(self, request, response, stats, started):
+        duration = time.perf_counter() - started
+        match = getattr(request, 'resolver_match', None)
+        route = match.route if match else 'unmatched'
+        labels = (route, request.method, response.status_code)
+        size = None if response.streaming else len(response.content)
+        registry.record(labels, duration, stats, size)
+
+        if self.query_threshold and stats.queries > self.query_threshold:
+            registry.record_query_alert(labels)
+            logger.warning(f"{request.method} {request.path} issued {stats.queries} SQL queries "
+                           f"(threshold {self.query_threshold})")
+
+
+# Adds time spent in to_representation to the current request's serializer time
+class TimedSerializerMixin:
+    def to_representation(self, instance):
+        stats = current_stats.get()
+        if stats is None or stats.serializer_depth:
+            return super().to_representation(instance)
+        stats.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            stats.serializer_time += time.perf_counter() - started
+            stats.serializer_depth -= 1
+
+
+def metrics_view(request):
+    allowed = getattr(settings, 'METRICS_ALLOWED_IPS', ['127.0.0.1', '::1'])
+    if allowed is not None and request.META.get('REMOTE_ADDR') not in allowed:
+        return HttpResponseForbidden()
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,67 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+
+from .routers import RoutingState, current_routing, mark_sticky
+
+
+class AsgiUrlconfMiddleware:
+    """
+    Resolves requests that arrive through ASGI against settings.ASGI_URLCONF so
+    they reach the async views. WSGI requests keep using ROOT_URLCONF.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.urlconf = getattr(settings, 'ASGI_URLCONF', None)
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.urlconf and isinstance(request, ASGIRequest):
+            request.urlconf = self.urlconf
+        return self.get_response(request)
+
+
+class ReplicaRoutingMiddleware:
+    """
+    Tracks database routing for one request (see routers.PrimaryReplicaRouter).
+    When the request wrote to the primary, its user is kept on the primary for
+    REPLICA_STICKY_SECONDS so their next reads see the write.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        state = RoutingState()
+        token = current_routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if state.wrote:
+            mark_sticky(getattr(request, 'user', None))
+        return response
+
+    async def __acall__(self, request):
+        state = RoutingState()
+        token = current_routing.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_routing.reset(token)
+        if state.wrote:
+            # request.user may still be the lazy session user, which queries
+            await sync_to_async(mark_sticky)(getattr(request, 'user', None))
+        return response
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0006_book_copies_available_bookinstance_borrower_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['book', 'status', 'borrow_date', 'return_date'], name='borrow_request_conflict_idx'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:13
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0007_borrowrequest_conflict_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='borrowrequest',
+            name='book_instance',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='library_api.bookinstance'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+from django.db import migrations
+
+
+def create_fulltext_index(apps, schema_editor):
+    # FULLTEXT indexes are MySQL specific; other backends search without one
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute("CREATE FULLTEXT INDEX book_fulltext_idx ON book (title, author, publisher)")
+
+
+def drop_fulltext_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute("DROP INDEX book_fulltext_idx ON book")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0008_borrowrequest_book_instance'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fulltext_index, drop_fulltext_index),
+    ]
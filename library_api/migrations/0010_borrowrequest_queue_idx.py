@@ -0,0 +1,21 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0009_book_fulltext_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['status', 'created_at', 'id'], name='borrow_request_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='borrowrequest',
+            index=models.Index(fields=['user', 'created_at', 'id'], name='borrow_request_user_idx'),
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:28
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0010_borrowrequest_queue_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BorrowRequestArchive',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('borrow_date', models.DateField()),
+                ('return_date', models.DateField()),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('denied', 'Denied')], max_length=10)),
+                ('created_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='library_api.book')),
+                ('book_instance', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='library_api.bookinstance')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Archived Borrow Request',
+                'verbose_name_plural': 'Archived Borrow Requests',
+                'db_table': 'borrow_request_archive',
+                'indexes': [models.Index(fields=['user', 'borrow_date'], name='borrow_archive_user_idx'), models.Index(fields=['borrow_date'], name='borrow_archive_date_idx')],
+            },
+        ),
+    ]
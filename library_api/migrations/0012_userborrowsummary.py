@@ -0,0 +1,31 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0011_borrowrequestarchive'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserBorrowSummary',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='borrow_summary', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('pending_count', models.IntegerField(default=0)),
+                ('approved_count', models.IntegerField(default=0)),
+                ('denied_count', models.IntegerField(default=0)),
+                ('loans', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'User Borrow Summary',
+                'verbose_name_plural': 'User Borrow Summaries',
+                'db_table': 'user_borrow_summary',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+from django.db import migrations
+from django.db.models import Count, OuterRef, Subquery
+
+
+def sync_copy_counts(apps, schema_editor):
+    Book = apps.get_model('library_api', 'Book')
+    BookInstance = apps.get_model('library_api', 'BookInstance')
+
+    # Copies are reserved per period through BorrowRequest.book_instance now;
+    # the flags set by the previous allocation no longer mean anything
+    BookInstance.objects.filter(is_borrowed=True).update(is_borrowed=False, borrower=None)
+
+    copies = BookInstance.objects.filter(book=OuterRef('pk')).order_by().values('book').annotate(n=Count('id')).values('n')
+    Book.objects.filter(pk__in=BookInstance.objects.values('book_id')).update(copies_available=Subquery(copies))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0012_userborrowsummary'),
+    ]
+
+    operations = [
+        migrations.RunPython(sync_copy_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:57
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def close_past_loans(apps, schema_editor):
+    # Returns were not recorded before: loans that have ended count as returned,
+    # and summaries are rebuilt on first use without them
+    today = timezone.localdate()
+    for name in ('BorrowRequest', 'BorrowRequestArchive'):
+        apps.get_model('library_api', name).objects.filter(status='approved', return_date__lt=today) \
+            .update(status='returned')
+    apps.get_model('library_api', 'UserBorrowSummary').objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0013_sync_copy_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userborrowsummary',
+            name='returned_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='borrowrequest',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('denied', 'Denied'), ('returned', 'Returned')], default='pending', max_length=10),
+        ),
+        migrations.AlterField(
+            model_name='borrowrequestarchive',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Pending'), ('approved', 'Approved'), ('denied', 'Denied'), ('returned', 'Returned')], max_length=10),
+        ),
+        migrations.RunPython(close_past_loans, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+
+def assign_loan_copies(apps, schema_editor):
+    """
+    Gives every approved loan without a copy, all of them approved before
+    copies were reserved per period, the first copy of its book that is free
+    for the whole period. A book without copies gets its `copies` first; a loan
+    that finds none free was lent all the same, so the book gets one more copy.
+    """
+    Book = apps.get_model('library_api', 'Book')
+    BookInstance = apps.get_model('library_api', 'BookInstance')
+    BorrowRequest = apps.get_model('library_api', 'BorrowRequest')
+
+    book_ids = BorrowRequest.objects.filter(status='approved', book_instance__isnull=True) \
+        .order_by().values_list('book_id', flat=True).distinct()
+    for book in Book.objects.filter(pk__in=list(book_ids)).iterator():
+        copies = list(BookInstance.objects.filter(book=book).order_by('id').values_list('id', flat=True))
+        if not copies:
+            BookInstance.objects.bulk_create([BookInstance(book=book) for _ in range(max(book.copies, 1))])
+            copies = list(BookInstance.objects.filter(book=book).order_by('id').values_list('id', flat=True))
+
+        held = defaultdict(list)
+        for copy_id, borrow_date, return_date in BorrowRequest.objects.filter(
+            book=book, status='approved', book_instance__isnull=False
+        ).values_list('book_instance_id', 'borrow_date', 'return_date'):
+            held[copy_id].append((borrow_date, return_date))
+
+        loans = list(BorrowRequest.objects.filter(book=book, status='approved', book_instance__isnull=True)
+                     .order_by('borrow_date', 'id'))
+        for loan in loans:
+            loan.book_instance_id = next((
+                copy_id for copy_id in copies
+                if not any(start < loan.return_date and end > loan.borrow_date for start, end in held[copy_id])
+            ), None)
+            if loan.book_instance_id is None:
+                loan.book_instance_id = BookInstance.objects.create(book=book).pk
+                copies.append(loan.book_instance_id)
+            held[loan.book_instance_id].append((loan.borrow_date, loan.return_date))
+        BorrowRequest.objects.bulk_update(loans, ['book_instance'], batch_size=1000)
+        Book.objects.filter(pk=book.pk).update(copies=len(copies))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('library_api', '0014_borrowrequest_returned'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='book',
+            old_name='copies_available',
+            new_name='copies',
+        ),
+        migrations.RemoveField(
+            model_name='bookinstance',
+            name='borrower',
+        ),
+        migrations.RemoveField(
+            model_name='bookinstance',
+            name='is_borrowed',
+        ),
+        migrations.RunPython(assign_loan_copies, migrations.RunPython.noop),
+    ]
@@ -75,7 +75,9 @@ class Book(models.Model):
     publisher = models.CharField(max_length=255)
     publication_date = models.DateField()
     isbn = models.CharField(max_length=13, unique=True)
-    copies_available = models.IntegerField(default=1)
+    # Number of copies. A book gets that many BookInstance rows on its first
+    # approval, and from then on the count follows them.
+    copies = models.IntegerField(default=1)
 
     class Meta:
         db_table = 'book'
@@ -86,17 +88,18 @@ class Book(models.Model):
         return self.title
 
 
+# A physical copy. Every approved borrow request reserves one for its period
+# through BorrowRequest.book_instance (see services.CopySchedule).
 class BookInstance(models.Model):
     book = models.ForeignKey(Book, related_name="instances", on_delete=models.CASCADE)
-    is_borrowed = models.BooleanField(default=False)
-    borrower = models.ForeignKey(User, null=True, blank=True, on_delete=models.SET_NULL)
 
     def __str__(self):
-        return f"{self.book.title} ({'Borrowed' if self.is_borrowed else 'Available'})"
+        return f"{self.book.title} (copy {self.pk})"
 
 
 class BorrowRequest(models.Model):
-    STATUS_CHOICES = [('pending', 'Pending'), ('approved', 'Approved'), ('denied', 'Denied')]
+    # An approved request is a loan until the copy is marked returned
+    STATUS_CHOICES = [('pending', 'Pending'), ('approved', 'Approved'), ('denied', 'Denied'), ('returned', 'Returned')]
 
     user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
@@ -104,11 +107,19 @@ class BorrowRequest(models.Model):
     return_date = models.DateField()
     status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
     created_at = models.DateTimeField(auto_now_add=True)
+    book_instance = models.ForeignKey(BookInstance, null=True, blank=True, on_delete=models.SET_NULL)
 
     class Meta:
         db_table = 'borrow_request'
         verbose_name = "Borrow Request"
         verbose_name_plural = "Borrow Requests"
+        indexes = [
+            # Covers the approved-overlap lookup in services.BorrowConflictChecker
+            models.Index(fields=['book', 'status', 'borrow_date', 'return_date'], name='borrow_request_conflict_idx'),
+            # Librarian queue: status filter walked in created_at order
+            models.Index(fields=['status', 'created_at', 'id'], name='borrow_request_queue_idx'),
+            models.Index(fields=['user', 'created_at', 'id'], name='borrow_request_user_idx'),
+        ]
         constraints = [
             models.UniqueConstraint(
                 fields=['book', 'borrow_date', 'return_date'],
@@ -117,4 +128,56 @@ class BorrowRequest(models.Model):
         ]
 
     def __str__(self):
-        return f"{self.user.username} - {self.book.title}"
\ No newline at end of file
+        return f"{self.user.username} - {self.book.title}"
+
+
+# Closed borrow requests moved out of borrow_request by the
+# archive_borrow_requests command. Rows keep their original ids and columns, so
+# history reads can combine both tables with the same lookups.
+class BorrowRequestArchive(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(get_user_model(), on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    borrow_date = models.DateField()
+    return_date = models.DateField()
+    status = models.CharField(max_length=10, choices=BorrowRequest.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    book_instance = models.ForeignKey(BookInstance, null=True, blank=True, on_delete=models.SET_NULL)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        db_table = 'borrow_request_archive'
+        verbose_name = "Archived Borrow Request"
+        verbose_name_plural = "Archived Borrow Requests"
+        indexes = [
+            models.Index(fields=['user', 'borrow_date'], name='borrow_archive_user_idx'),
+            # Also answers the archive horizon (latest archived borrow_date)
+            models.Index(fields=['borrow_date'], name='borrow_archive_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.book.title}"
+
+
+# Denormalized per-user view of borrow requests, kept in step with them by
+# library_api.summaries and rebuilt by the rebuild_borrow_summaries command.
+# `loans` lists the outstanding loans, approved requests holding a copy that
+# is not returned yet, as [request id, book id, borrow_date, return_date] with
+# ISO dates.
+class UserBorrowSummary(models.Model):
+    user = models.OneToOneField(get_user_model(), primary_key=True, related_name='borrow_summary',
+                                on_delete=models.CASCADE)
+    pending_count = models.IntegerField(default=0)
+    approved_count = models.IntegerField(default=0)
+    denied_count = models.IntegerField(default=0)
+    returned_count = models.IntegerField(default=0)
+    loans = models.JSONField(default=list)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        db_table = 'user_borrow_summary'
+        verbose_name = "User Borrow Summary"
+        verbose_name_plural = "User Borrow Summaries"
+
+    def __str__(self):
+        return f"{self.user_id}: {self.pending_count} pending, {self.approved_count} approved, {self.denied_count} denied"
@@ -0,0 +1,37 @@
+from django.conf import settings
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+# Keyset pagination for the book catalog. The cursor encodes the last seen id,
+# so every page is an indexed range scan instead of an OFFSET.
+class BookCursorPagination(CursorPagination):
+    page_size = getattr(settings, 'BOOKS_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'BOOKS_MAX_PAGE_SIZE', 500)
+    ordering = 'id'
+
+
+# Keyset pagination for the librarian borrow-request queue, oldest first by
+# default. ?ordering= picks one of ordering_fields (prefix '-' for descending);
+# id breaks ties so pages stay stable when timestamps or dates repeat.
+class BorrowRequestCursorPagination(CursorPagination):
+    page_size = getattr(settings, 'BORROW_REQUESTS_PAGE_SIZE', 50)
+    page_size_query_param = 'page_size'
+    max_page_size = getattr(settings, 'BORROW_REQUESTS_MAX_PAGE_SIZE', 500)
+    ordering = 'created_at'
+    ordering_fields = ('created_at', 'borrow_date', 'id')
+
+    def get_ordering(self, request, queryset, view):
+        ordering = request.query_params.get('ordering') or self.ordering
+        if ordering.lstrip('-') not in self.ordering_fields:
+            # Unknown values are ignored, as with DRF's OrderingFilter
+            ordering = self.ordering
+        if ordering.lstrip('-') == 'id':
+            return (ordering,)
+        return (ordering, '-id' if ordering.startswith('-') else 'id')
+
+
+# Offset pagination over ranked search results
+class BookSearchPagination(LimitOffsetPagination):
+    default_limit = 20
+    max_limit = 100
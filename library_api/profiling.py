@@ -0,0 +1,371 @@
+import contextvars
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-Profile-Request'
+RESPONSE_HEADER = 'X-Profile-Id'
+
+# The capture of the request being profiled, set by RequestProfilingMiddleware
+current_capture = contextvars.ContextVar('library_api_profile_capture', default=None)
+
+
+class StackSampler:
+    """
+    Samples the Python stacks of `thread_ids` (every thread but its own when
+    None) every `interval` seconds from a background thread. Stacks are counted
+    as tuples of code objects, root first, labelled with the thread name.
+    """
+
+    def __init__(self, interval, thread_ids=None):
+        self.interval = interval
+        self.thread_ids = thread_ids
+        self.counts = Counter()
+        self.samples = 0
+        self.duration = 0.0
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self.run, name='request-profiler', daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self.duration = time.perf_counter() - self._started
+
+    def run(self):
+        own = threading.get_ident()
+        while not self._stopped.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own or (self.thread_ids is not None and ident not in self.thread_ids):
+                    continue
+                stack = []
+                while frame is not None:
+                    stack.append(frame.f_code)
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.counts[tuple(reversed(stack))] += 1
+            self.samples += 1
+
+
+class Capture:
+    def __init__(self, trigger):
+        self.id = f'{time.time_ns()}-{uuid.uuid4().hex[:8]}'
+        self.trigger = trigger
+        self.started_at = timezone.now()
+        self.started = time.perf_counter()
+        self.max_queries = getattr(settings, 'PROFILING_MAX_QUERIES', 2000)
+        self.queries = []
+        self.queries_dropped = 0
+        self.db_time = 0.0
+        self._lock = threading.Lock()
+        # Queries slow enough to be explained, with their raw parameters
+        self.slow = []
+
+    def record_query(self, alias, sql, params, many, started, duration):
+        with self._lock:
+            self.db_time += duration
+            if len(self.queries) >= self.max_queries:
+                self.queries_dropped += 1
+                return
+            query = {
+                "alias": alias,
+                "sql": sql,
+                "params": [repr(param)[:200] for param in params] if params and not many else None,
+                "many": len(params) if many else None,
+                "start": started - self.started,
+                "duration": duration,
+            }
+            self.queries.append(query)
+            if not many and duration >= getattr(settings, 'PROFILING_EXPLAIN_THRESHOLD', 0.1):
+                self.slow.append((query, params))
+
+
+# Records every query of the profiled request, including those run by async ORM
+# calls, since the context variable follows the request into their threads
+def trace_query(execute, sql, params, many, context):
+    capture = current_capture.get()
+    if capture is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        capture.record_query(context['connection'].alias, sql, params, many, started, time.perf_counter() - started)
+
+
+@receiver(connection_created)
+def install_query_tracer(sender, connection, **kwargs):
+    if trace_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(trace_query)
+
+
+def explain_slow_queries(capture):
+    """
+    Adds the plan of each slow SELECT to its entry. Runs after the request, on
+    the connection the query used; the statements are not executed again.
+    """
+    for query, params in capture.slow:
+        if not query["sql"].lstrip().upper().startswith(('SELECT', 'WITH')):
+            continue
+        connection = connections[query["alias"]]
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute(f'{connection.ops.explain_query_prefix()} {query["sql"]}', params)
+                query["explain"] = [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+        except Exception as exc:
+            query["explain_error"] = str(exc)
+
+
+def frame_name(code):
+    # Thread names are plain strings at the root of each stack
+    if isinstance(code, str):
+        return code
+    return f'{code.co_name} ({short_path(code.co_filename)}:{code.co_firstlineno})'
+
+
+_path_prefixes = None
+
+
+def short_path(filename):
+    # Relative to the longest sys.path entry containing it, like a module path
+    global _path_prefixes
+    if _path_prefixes is None:
+        _path_prefixes = sorted({os.path.join(os.path.abspath(p or '.'), '') for p in sys.path}, key=len, reverse=True)
+    for prefix in _path_prefixes:
+        if filename.startswith(prefix):
+            return filename[len(prefix):]
+    return filename
+
+
+def capture_document(capture, request, response, sampler):
+    match = getattr(request, 'resolver_match', None)
+    user = getattr(request, 'user', None)
+    return {
+        "id": capture.id,
+        "trigger": capture.trigger,
+        "started_at": capture.started_at.isoformat(),
+        "duration": sampler.duration,
+        "method": request.method,
+        "path": request.path,
+        "query_string": request.META.get('QUERY_STRING', ''),
+        "route": match.route if match else None,
+        "view": match.view_name if match else None,
+        "user": getattr(user, 'pk', None),
+        "status": response.status_code,
+        "streaming": response.streaming,
+        "sample_interval": sampler.duration / sampler.samples if sampler.samples else sampler.interval,
+        "samples": sampler.samples,
+        "stacks": [[[frame_name(code) for code in stack], count] for stack, count in sampler.counts.most_common()],
+        "db_time": capture.db_time,
+        "queries": capture.queries,
+        "queries_dropped": capture.queries_dropped,
+    }
+
+
+class ProfileStore:
+    """
+    Bounded on-disk ring buffer of captures, one JSON file each in PROFILING_DIR.
+    File names start with the capture time, so once PROFILING_MAX_CAPTURES is
+    exceeded the oldest files are removed. Safe to share between processes.
+    """
+
+    def __init__(self, directory=None, max_captures=None):
+        self.directory = str(directory or getattr(settings, 'PROFILING_DIR', 'profiles'))
+        self.max_captures = max_captures or getattr(settings, 'PROFILING_MAX_CAPTURES', 100)
+
+    def save(self, document):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{document["id"]}.json')
+        # Written aside and renamed, so readers never see a partial capture
+        with open(path + '.tmp', 'w') as capture_file:
+            json.dump(document, capture_file)
+        os.replace(path + '.tmp', path)
+        for capture_id in self.ids()[:-self.max_captures]:
+            try:
+                os.remove(os.path.join(self.directory, f'{capture_id}.json'))
+            except FileNotFoundError:
+                # Pruned by another process
+                pass
+        return path
+
+    def ids(self):
+        # Oldest first
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(name[:-len('.json')] for name in names if name.endswith('.json'))
+
+    def load(self, capture_id):
+        with open(os.path.join(self.directory, f'{os.path.basename(capture_id)}.json')) as capture_file:
+            return json.load(capture_file)
+
+
+def to_collapsed(document):
+    """
+    Folded stacks, one "frame;frame;...;frame count" line per stack, as read by
+    flamegraph.pl, speedscope and most flame graph tools.
+    """
+    return ''.join(f'{";".join(frame.replace(";", ":") for frame in stack)} {count}\n'
+                   for stack, count in document["stacks"])
+
+
+def to_speedscope(document):
+    """
+    Speedscope file with two sampled profiles: the Python stacks, weighted by
+    the sampling interval, and the SQL statements, weighted by their duration.
+    """
+    frames, index = [], {}
+
+    def frame_id(name):
+        if name not in index:
+            index[name] = len(frames)
+            frames.append({"name": name})
+        return index[name]
+
+    interval = document["sample_interval"]
+    stacks = [[frame_id(frame) for frame in stack] for stack, count in document["stacks"]]
+    python_weights = [count * interval for stack, count in document["stacks"]]
+    queries = [[frame_id('SQL'), frame_id(' '.join(query["sql"].split())[:500])] for query in document["queries"]]
+    sql_weights = [query["duration"] for query in document["queries"]]
+
+    name = f'{document["method"]} {document["path"]} ({document["id"]})'
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "name": name,
+        "exporter": "library_api.profiling",
+        "activeProfileIndex": 0,
+        "shared": {"frames": frames},
+        "profiles": [
+            {"type": "sampled", "name": f'{name} Python', "unit": "seconds", "startValue": 0,
+             "endValue": sum(python_weights), "samples": stacks, "weights": python_weights},
+            {"type": "sampled", "name": f'{name} SQL', "unit": "seconds", "startValue": 0,
+             "endValue": sum(sql_weights), "samples": queries, "weights": sql_weights},
+        ],
+    }
+
+
+def profiling_trigger(request):
+    if request.headers.get(HEADER):
+        return 'header'
+    if random.random() < getattr(settings, 'PROFILING_SAMPLE_RATE', 0.0):
+        return 'sample'
+    return None
+
+
+def request_user(request):
+    """
+    The user a triggered request is made by, or None. API requests are
+    authenticated ahead of the view with the DRF authentication classes, which
+    resolve from the user cache.
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    from rest_framework.exceptions import APIException
+    from rest_framework.request import Request
+    from rest_framework.settings import api_settings
+
+    try:
+        drf_request = Request(request, authenticators=[auth() for auth in api_settings.DEFAULT_AUTHENTICATION_CLASSES])
+        return drf_request.user
+    except APIException:
+        return None
+
+
+class RequestProfilingMiddleware:
+    """
+    Profiles requests of staff users that send the X-Profile-Request header, or
+    are picked at PROFILING_SAMPLE_RATE: their Python stacks are sampled every
+    PROFILING_INTERVAL seconds and every SQL statement is recorded, with the plan
+    of SELECTs slower than PROFILING_EXPLAIN_THRESHOLD. Captures are stored in a
+    ProfileStore and their id returned in X-Profile-Id; export them with the
+    export_profiles command.
+
+    Under WSGI only the request's thread is sampled. Under ASGI the request runs
+    on the event loop and worker threads, so every thread is sampled and other
+    requests served meanwhile show up as well. The body of a streaming response
+    is produced after the capture ends.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.interval = getattr(settings, 'PROFILING_INTERVAL', 0.005)
+        self.store = ProfileStore()
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        for conn in connections.all(initialized_only=True):
+            install_query_tracer(sender=None, connection=conn)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        trigger = profiling_trigger(request)
+        if trigger is None:
+            return self.get_response(request)
+        user = request_user(request)
+        if user is None or not user.is_staff:
+            return self.get_response(request)
+
+        capture = Capture(trigger)
+        sampler = StackSampler(self.interval, {threading.get_ident()})
+        token = current_capture.set(capture)
+        sampler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            sampler.stop()
+            current_capture.reset(token)
+        self.save(capture, request, response, sampler)
+        return response
+
+    async def __acall__(self, request):
+        trigger = profiling_trigger(request)
+        if trigger is None:
+            return await self.get_response(request)
+        user = await sync_to_async(request_user)(request)
+        if user is None or not user.is_staff:
+            return await self.get_response(request)
+
+        capture = Capture(trigger)
+        sampler = StackSampler(self.interval)
+        token = current_capture.set(capture)
+        sampler.start()
+        try:
+            response = await self.get_response(request)
+        finally:
+            sampler.stop()
+            current_capture.reset(token)
+        await sync_to_async(self.save)(capture, request, response, sampler)
+        return response
+
+    def save(self, capture, request, response, sampler):
+        try:
+            explain_slow_queries(capture)
+            self.store.save(capture_document(capture, request, response, sampler))
+        except Exception:
+            logger.exception("Storing the profile of %s %s failed", request.method, request.path)
+            return
+        response[RESPONSE_HEADER] = capture.id
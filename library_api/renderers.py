@@ -0,0 +1,33 @@
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that encodes with orjson when it is installed and
+    JSON_RENDERER_BACKEND is 'orjson'. Output is byte-identical to JSONRenderer:
+    dates and times, Decimals and other non-native types go through DRF's
+    encoder, and anything orjson refuses (or indented output) falls back to the
+    stock renderer.
+    """
+    backend = getattr(settings, 'JSON_RENDERER_BACKEND', 'orjson')
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if orjson is None or self.backend != 'orjson' or data is None or self.ensure_ascii or not self.compact:
+            return super().render(data, accepted_media_type, renderer_context)
+        if self.get_indent(accepted_media_type, renderer_context or {}) is not None:
+            return super().render(data, accepted_media_type, renderer_context)
+
+        try:
+            ret = orjson.dumps(data, default=self.encode_default, option=orjson.OPT_PASSTHROUGH_DATETIME)
+        except orjson.JSONEncodeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        return ret.replace('\u2028'.encode(), b'\\u2028').replace('\u2029'.encode(), b'\\u2029')
+
+    def encode_default(self, obj):
+        return self.encoder_class().default(obj)
@@ -0,0 +1,103 @@
+import contextvars
+import random
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework.permissions import SAFE_METHODS
+
+# Per-request routing state, set by ReplicaRoutingMiddleware
+current_routing = contextvars.ContextVar('library_api_db_routing', default=None)
+
+
+class RoutingState:
+    __slots__ = ('use_replica', 'wrote')
+
+    def __init__(self):
+        self.use_replica = False
+        self.wrote = False
+
+
+def replica_aliases():
+    aliases = getattr(settings, 'REPLICA_DATABASES', None)
+    if aliases is None:
+        aliases = [alias for alias in settings.DATABASES if alias != 'default']
+    return aliases
+
+
+def sticky_cache():
+    return caches[getattr(settings, 'REPLICA_STICKY_CACHE_ALIAS', 'default')]
+
+
+def sticky_key(user_id):
+    return f'db:sticky:{user_id}'
+
+
+def is_sticky(user):
+    """
+    Whether `user` wrote within the last REPLICA_STICKY_SECONDS, in which case
+    their reads stay on the primary so they see their own writes.
+    """
+    if not getattr(user, 'is_authenticated', False):
+        return False
+    return sticky_cache().get(sticky_key(user.pk)) is not None
+
+
+def mark_sticky(user):
+    timeout = getattr(settings, 'REPLICA_STICKY_SECONDS', 5)
+    if timeout and getattr(user, 'is_authenticated', False):
+        sticky_cache().set(sticky_key(user.pk), 1, timeout)
+
+
+def route_reads_to_replica(request, user):
+    """
+    Lets the rest of the request read from a replica. Called by read-only views
+    once the user is authenticated; has no effect outside
+    ReplicaRoutingMiddleware, for unsafe methods or for sticky users.
+    """
+    state = current_routing.get()
+    if state is None or request.method not in SAFE_METHODS or is_sticky(user):
+        return False
+    state.use_replica = True
+    return True
+
+
+class PrimaryReplicaRouter:
+    """
+    Sends writes to `default` and, when the current request was marked
+    read-only, reads to a random replica (REPLICA_DATABASES, or every alias
+    other than `default`). Everything else reads from the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = current_routing.get()
+        if state is not None and state.use_replica and not state.wrote:
+            aliases = replica_aliases()
+            if aliases:
+                return random.choice(aliases)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        state = current_routing.get()
+        if state is not None:
+            state.wrote = True
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same data as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Allowed everywhere so `migrate --database=<replica>` can build a local
+        # stand-in; real replicas receive the schema through replication.
+        return True
+
+
+class ReplicaReadMixin:
+    """
+    APIView mixin for read-only endpoints: after authentication, safe requests
+    from users that did not just write are served from a replica.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        route_reads_to_replica(request, request.user)
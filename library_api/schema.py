@@ -0,0 +1,84 @@
+import logging
+import threading
+
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.http import require_safe
+
+logger = logging.getLogger(__name__)
+
+# drf_yasg is only imported by the functions below, so loading the urlconf (and
+# booting a worker) does not pay for it. The OpenAPI document is generated by
+# the generate_openapi_schema command at build time and served from a file.
+
+_lock = threading.Lock()
+_schema_bytes = None
+_ui_view = None
+
+
+def api_info():
+    from drf_yasg import openapi
+
+    return openapi.Info(
+        title="Library Management System API",
+        default_version='v1',
+        description="API documentation for the Library Management System",
+        contact=openapi.Contact(email="example@example.com"),
+        security=[{
+            "Bearer": {
+                "type": "apiKey",
+                "name": "Authorization",
+                "in": "header"
+            }
+        }],
+    )
+
+
+def generate_schema():
+    """
+    Introspects every view and returns the OpenAPI document as JSON bytes.
+    """
+    from drf_yasg.codecs import OpenAPICodecJson
+    from drf_yasg.generators import OpenAPISchemaGenerator
+
+    generator = OpenAPISchemaGenerator(api_info(), url=getattr(settings, 'OPENAPI_SCHEMA_URL', None))
+    return OpenAPICodecJson(validators=[], pretty=True).encode(generator.get_schema(request=None, public=True))
+
+
+def load_schema():
+    global _schema_bytes
+    if _schema_bytes is None:
+        with _lock:
+            if _schema_bytes is None:
+                path = getattr(settings, 'OPENAPI_SCHEMA_PATH', None)
+                try:
+                    with open(path, 'rb') as schema_file:
+                        _schema_bytes = schema_file.read()
+                except (OSError, TypeError):
+                    logger.warning("OpenAPI schema file %s not found; generating it in process. "
+                                   "Run manage.py generate_openapi_schema at build time.", path)
+                    _schema_bytes = generate_schema()
+    return _schema_bytes
+
+
+def ui_view():
+    global _ui_view
+    if _ui_view is None:
+        with _lock:
+            if _ui_view is None:
+                from drf_yasg.views import get_schema_view
+                from rest_framework.permissions import AllowAny
+
+                schema_view = get_schema_view(api_info(), public=True, permission_classes=(AllowAny,))
+                # The UI page itself carries no endpoints, so caching it is cheap
+                _ui_view = schema_view.with_ui('swagger', cache_timeout=getattr(settings, 'SWAGGER_UI_CACHE_TIMEOUT', 3600))
+    return _ui_view
+
+
+# Swagger UI. The page loads its spec from this same URL with ?format=openapi,
+# which is answered from the precomputed file without importing drf_yasg.
+@require_safe
+def swagger_view(request, *args, **kwargs):
+    if request.GET.get('format') == 'openapi':
+        return HttpResponse(load_schema(), content_type='application/json')
+    return ui_view()(request, *args, **kwargs)
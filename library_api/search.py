@@ -0,0 +1,203 @@
+import bisect
+import re
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.utils.module_loading import import_string
+
+from .models import Book
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Relative weight of a hit in each searchable field
+FIELD_WEIGHTS = {'title': 3.0, 'author': 2.0, 'publisher': 1.0}
+
+# Score multiplier per kind of term match
+EXACT, PREFIX, TYPO = 1.0, 0.6, 0.4
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def deletions(token):
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+
+class BaseSearchBackend:
+    def search(self, query):
+        """
+        Returns the ids of matching books, best match first.
+        """
+        raise NotImplementedError
+
+    def add(self, book):
+        pass
+
+    def remove(self, book_id):
+        pass
+
+    def invalidate(self):
+        pass
+
+
+class InMemorySearchBackend(BaseSearchBackend):
+    """
+    Inverted index over title, author and publisher held in process memory.
+
+    Every query term matches indexed terms exactly, by prefix, or (for terms of
+    four or more characters) within one edit through a deletion index. A book
+    must match every query term; its score is the sum of the best field weight
+    times match quality for each term. The index is built lazily from the
+    database, kept current through Book signals and rebuilt after
+    BOOK_SEARCH_INDEX_TTL seconds so changes made by other processes show up.
+    """
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl if ttl is not None else getattr(settings, 'BOOK_SEARCH_INDEX_TTL', 300)
+        self._lock = threading.RLock()
+        self._expires = 0
+
+    def search(self, query):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        with self._lock:
+            self._ensure_built()
+            scores = None
+            for term in terms:
+                term_scores = self._term_scores(term)
+                if scores is None:
+                    scores = term_scores
+                else:
+                    scores = {book_id: score + term_scores[book_id]
+                              for book_id, score in scores.items() if book_id in term_scores}
+                if not scores:
+                    return []
+        return sorted(scores, key=lambda book_id: (-scores[book_id], book_id))
+
+    def add(self, book):
+        with self._lock:
+            if not self._expires:
+                return
+            self._remove(book.pk)
+            self._add(book.pk, {field: getattr(book, field) for field in FIELD_WEIGHTS})
+
+    def remove(self, book_id):
+        with self._lock:
+            if self._expires:
+                self._remove(book_id)
+
+    def invalidate(self):
+        with self._lock:
+            self._expires = 0
+
+    def _ensure_built(self):
+        if self._expires > time.monotonic():
+            return
+        self._postings = defaultdict(dict)   # term -> {book_id: best field weight}
+        self._terms = []                     # sorted distinct terms, for prefix lookups
+        self._deletes = defaultdict(set)     # deletion variant -> terms
+        self._documents = {}                 # book_id -> terms, for removal
+        for row in Book.objects.values_list('id', *FIELD_WEIGHTS).iterator(chunk_size=5000):
+            self._add(row[0], dict(zip(FIELD_WEIGHTS, row[1:])))
+        self._expires = time.monotonic() + self.ttl
+
+    def _add(self, book_id, fields):
+        terms = set()
+        for field, text in fields.items():
+            for term in tokenize(text or ''):
+                terms.add(term)
+                postings = self._postings[term]
+                if not postings:
+                    bisect.insort(self._terms, term)
+                    for variant in deletions(term):
+                        self._deletes[variant].add(term)
+                postings[book_id] = max(postings.get(book_id, 0), FIELD_WEIGHTS[field])
+        self._documents[book_id] = terms
+
+    def _remove(self, book_id):
+        for term in self._documents.pop(book_id, ()):
+            postings = self._postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(book_id, None)
+            if not postings:
+                del self._postings[term]
+                self._terms.pop(bisect.bisect_left(self._terms, term))
+                for variant in deletions(term):
+                    self._deletes[variant].discard(term)
+
+    def _term_scores(self, term):
+        matches = {}
+        # Prefix matches (including the exact term) from the sorted term list
+        i = bisect.bisect_left(self._terms, term)
+        while i < len(self._terms) and self._terms[i].startswith(term):
+            candidate = self._terms[i]
+            matches[candidate] = EXACT if candidate == term else PREFIX
+            i += 1
+
+        # Terms within one edit: insertions, deletions and substitutions
+        if len(term) >= 4:
+            candidates = set(self._deletes.get(term, ()))
+            if term in self._postings:
+                candidates.add(term)
+            for variant in deletions(term):
+                if variant in self._postings:
+                    candidates.add(variant)
+                candidates.update(self._deletes.get(variant, ()))
+            for candidate in candidates:
+                matches.setdefault(candidate, TYPO)
+
+        scores = {}
+        for candidate, quality in matches.items():
+            for book_id, weight in self._postings.get(candidate, {}).items():
+                scores[book_id] = max(scores.get(book_id, 0), weight * quality)
+        return scores
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Searches in the database. On MySQL this uses the FULLTEXT index on title,
+    author and publisher in boolean mode with prefix terms, ranked by relevance;
+    other databases fall back to unranked substring matching.
+    """
+
+    def search(self, query):
+        terms = tokenize(query)
+        if not terms:
+            return []
+
+        if connection.vendor == 'mysql':
+            against = ' '.join(f'+{term}*' for term in terms)
+            match = "MATCH(title, author, publisher) AGAINST (%s IN BOOLEAN MODE)"
+            books = Book.objects.extra(
+                select={'relevance': match}, select_params=[against],
+                where=[match], params=[against],
+                order_by=['-relevance', 'id'],
+            )
+            return list(books.values_list('id', flat=True))
+
+        condition = Q()
+        for term in terms:
+            condition &= Q(title__icontains=term) | Q(author__icontains=term) | Q(publisher__icontains=term)
+        return list(Book.objects.filter(condition).order_by('id').values_list('id', flat=True))
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def get_search_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                path = getattr(settings, 'BOOK_SEARCH_BACKEND', 'library_api.search.InMemorySearchBackend')
+                _backend = import_string(path)()
+    return _backend
@@ -1,8 +1,13 @@
+import time
+
+from django.db import models
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
 from .models import User, Book, BorrowRequest
+from .metrics import TimedSerializerMixin, current_stats
 
 # User Serializer for User Model
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ['id', 'username', 'email', 'password', 'role']
@@ -21,8 +26,30 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+# User Serializer for bulk provisioning: username/email collisions are checked
+# for a whole batch at once, so the per-row unique lookups are dropped
+class UserProvisionSerializer(UserSerializer):
+    class Meta(UserSerializer.Meta):
+        extra_kwargs = {
+            'password': {'write_only': True, 'min_length': 8},
+            'username': {'validators': []},
+            'email': {'validators': []},
+        }
+
+
+# Token serializer that embeds the claims CachedJWTAuthentication can trust
+class LibraryTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token['username'] = user.username
+        token['role'] = user.role
+        token['is_staff'] = user.is_staff
+        return token
+
+
 # Book Serializer for Book Model
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Book
         fields = ['id', 'title', 'author', 'publisher', 'publication_date', 'isbn']
@@ -34,7 +61,16 @@ class BookSerializer(serializers.ModelSerializer):
         return value
 
 
-class BorrowRequestSerializer(serializers.ModelSerializer):
+# Book Serializer for bulk imports: isbn uniqueness is resolved by the upsert,
+# so the per-row unique lookup is dropped while validate_isbn still applies
+class BookImportSerializer(BookSerializer):
+    class Meta(BookSerializer.Meta):
+        extra_kwargs = {
+            'isbn': {'validators': []},
+        }
+
+
+class BorrowRequestSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = BorrowRequest
         fields = ['id', 'book', 'user', 'borrow_date', 'return_date', 'status']
@@ -50,3 +86,59 @@ class BorrowRequestSerializer(serializers.ModelSerializer):
         validated_data['user'] = self.context['request'].user
         return super().create(validated_data)
 
+
+# Read-only fast path for list endpoints: rows come straight from values_list()
+# tuples, skipping model instances and per-row field objects. The output keys
+# and formatting follow the ModelSerializer it is built from, so responses are
+# identical to serializing with it (foreign keys as ids, dates as ISO strings).
+class ValuesListSerializer:
+    def __init__(self, serializer_class, fields=None, always=()):
+        meta = serializer_class.Meta
+        self.serializer_class = serializer_class
+        self.keys = tuple(fields or meta.fields)
+        model_fields = [meta.model._meta.get_field(name) for name in self.keys]
+        # Lookups in `always` are read after the output fields (e.g. the cursor
+        # position) but are not part of the output
+        self.lookups = tuple(field.attname for field in model_fields)
+        self.lookups += tuple(lookup for lookup in always if lookup not in self.lookups)
+        self.date_positions = tuple(
+            i for i, field in enumerate(model_fields)
+            if isinstance(field, models.DateField) and not isinstance(field, models.DateTimeField)
+        )
+
+    def project(self, fields=None, exclude=None, always=()):
+        """
+        Returns a serializer limited to `fields` minus `exclude`, reading only those columns.
+        """
+        unknown = [name for name in (fields or []) + (exclude or []) if name not in self.keys]
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(unknown)}. Available: {', '.join(self.keys)}.")
+        keys = [key for key in self.keys if (not fields or key in fields) and key not in (exclude or [])]
+        if not keys:
+            raise ValueError("At least one field must be selected.")
+        return ValuesListSerializer(self.serializer_class, keys, always)
+
+    def values(self, queryset, named=False):
+        return queryset.values_list(*self.lookups, named=named)
+
+    def serialize(self, rows):
+        started = time.perf_counter()
+        keys, date_positions = self.keys, self.date_positions
+        data = []
+        for row in rows:
+            if date_positions:
+                row = list(row)
+                for i in date_positions:
+                    if row[i] is not None:
+                        row[i] = row[i].isoformat()
+            # zip stops at the output keys, dropping any `always` lookups
+            data.append(dict(zip(keys, row)))
+
+        stats = current_stats.get()
+        if stats is not None:
+            stats.serializer_time += time.perf_counter() - started
+        return data
+
+
+book_list_serializer = ValuesListSerializer(BookSerializer)
+borrow_request_list_serializer = ValuesListSerializer(BorrowRequestSerializer)
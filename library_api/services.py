@@ -0,0 +1,509 @@
+import bisect
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Max
+from django.utils import timezone
+
+from .models import Book, BookInstance, BorrowRequest, BorrowRequestArchive
+from .summaries import record_borrow_changes
+from .events import publish_borrow_requests
+
+
+# Detects whether a requested borrow period finds every copy of a book lent on
+# some day, by the same rule as book_availability. Approved intervals are cached
+# per book, with the book's capacity, as lists of start and end dates plus a
+# running maximum of end dates: a bisect on the starts and a walk back while the
+# running maximum passes borrow_date yield exactly the overlapping loans, and
+# the check stops there when they are fewer than the copies. Cache entries are
+# dropped whenever a borrow request or copy of the book is saved or deleted (see
+# signals.py) and expire after a short TTL so other worker processes pick up
+# changes too.
+class BorrowConflictChecker:
+    def __init__(self, max_books=None, ttl=None):
+        self.max_books = max_books or getattr(settings, 'BORROW_CONFLICT_CACHE_SIZE', 1024)
+        self.ttl = ttl if ttl is not None else getattr(settings, 'BORROW_CONFLICT_CACHE_TTL', 30)
+        self._intervals = OrderedDict()
+        self._lock = threading.Lock()
+
+    def has_conflict(self, book, borrow_date, return_date, use_cache=True):
+        book_id = getattr(book, 'pk', book)
+        if not use_cache:
+            return self.query_conflict(book_id, borrow_date, return_date)
+
+        capacity, starts, ends, max_ends = self._get_intervals(book_id)
+        overlapping = []
+        idx = bisect.bisect_left(starts, return_date) - 1
+        while idx >= 0 and max_ends[idx] > borrow_date:
+            if ends[idx] > borrow_date:
+                overlapping.append((starts[idx], ends[idx]))
+            idx -= 1
+        return len(overlapping) >= capacity and is_fully_booked(overlapping, capacity, borrow_date, return_date)
+
+    def query_conflict(self, book_id, borrow_date, return_date):
+        # Served by the (book, status, borrow_date, return_date) index
+        periods = list(overlapping_loans(borrow_date, return_date, book_id=book_id)
+                       .values_list('borrow_date', 'return_date'))
+        capacity = book_capacities([book_id]).get(book_id, 1)
+        return len(periods) >= capacity and is_fully_booked(periods, capacity, borrow_date, return_date)
+
+    def invalidate(self, book_id=None):
+        with self._lock:
+            if book_id is None:
+                self._intervals.clear()
+            else:
+                self._intervals.pop(book_id, None)
+
+    def _get_intervals(self, book_id):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._intervals.get(book_id)
+            if entry is not None and entry[0] > now:
+                self._intervals.move_to_end(book_id)
+                return entry[1:]
+
+        capacity = book_capacities([book_id]).get(book_id, 1)
+        rows = BorrowRequest.objects.filter(book_id=book_id, status='approved') \
+            .order_by('borrow_date').values_list('borrow_date', 'return_date')
+        starts, ends, max_ends = [], [], []
+        for borrow_date, return_date in rows:
+            starts.append(borrow_date)
+            ends.append(return_date)
+            max_ends.append(max(max_ends[-1], return_date) if max_ends else return_date)
+
+        with self._lock:
+            self._intervals[book_id] = (now + self.ttl, capacity, starts, ends, max_ends)
+            self._intervals.move_to_end(book_id)
+            while len(self._intervals) > self.max_books:
+                self._intervals.popitem(last=False)
+        return capacity, starts, ends, max_ends
+
+
+conflict_checker = BorrowConflictChecker()
+
+
+def has_borrow_conflict(book, borrow_date, return_date):
+    return conflict_checker.has_conflict(book, borrow_date, return_date)
+
+
+class NoCopyAvailable(Exception):
+    pass
+
+
+class NotOnLoan(Exception):
+    pass
+
+
+# Saves a validated BorrowRequestSerializer and counts the new request in its
+# user's borrowing summary, in one transaction
+def create_borrow_request(serializer, **kwargs):
+    with transaction.atomic():
+        borrow_request = serializer.save(**kwargs)
+        record_borrow_changes([(borrow_request, None)])
+        transaction.on_commit(lambda: publish_borrow_requests('created', [borrow_request]), robust=True)
+    return borrow_request
+
+
+def overlapping_loans(borrow_date, return_date, **filters):
+    # Approved requests whose period shares a day with [borrow_date, return_date)
+    return BorrowRequest.objects.filter(status='approved', borrow_date__lt=return_date,
+                                        return_date__gt=borrow_date, **filters)
+
+
+class CopySchedule:
+    """
+    The approved loans of one book and the copy each one holds. A loan reserves
+    its copy from borrow_date up to (not including) return_date, so one copy
+    serves any number of loans that do not overlap.
+    """
+
+    def __init__(self, copy_ids, loans, today):
+        self.copy_ids = list(copy_ids)
+        # Loan id -> [copy id, borrow_date, return_date]
+        self.loans = {pk: [copy_id, borrow_date, return_date] for pk, copy_id, borrow_date, return_date in loans}
+        self.today = today
+        # Loans that allocate() gave another copy, loan id -> copy id
+        self.moved = {}
+
+    def is_free(self, copy_id, borrow_date, return_date):
+        return not any(loan[0] == copy_id and loan[1] < return_date and loan[2] > borrow_date
+                       for loan in self.loans.values())
+
+    def allocate(self, pk, borrow_date, return_date):
+        """
+        Adds loan `pk` and returns the copy it holds, or None when the copies
+        cannot cover the period.
+        """
+        copy_id = next((copy_id for copy_id in self.copy_ids if self.is_free(copy_id, borrow_date, return_date)), None)
+        if copy_id is None:
+            return self.reschedule(pk, borrow_date, return_date)
+        self.loans[pk] = [copy_id, borrow_date, return_date]
+        return copy_id
+
+    def reschedule(self, pk, borrow_date, return_date):
+        # No copy is free for the whole period, but on each day one may be. Loans
+        # that have not started and do not start before borrow_date are given
+        # copies again in start order, each a copy that is free when it starts:
+        # that needs no more copies than are ever in use at once. Loans already
+        # started, or starting earlier, keep their copy.
+        loans = {p: loan for p, loan in self.loans.items() if loan[2] > borrow_date}
+        loans[pk] = [None, borrow_date, return_date]
+        movable = [p for p, (copy_id, start, end) in loans.items()
+                   if copy_id is None or (start >= borrow_date and start > self.today)]
+
+        free_at = dict.fromkeys(self.copy_ids)
+        for p, (copy_id, start, end) in loans.items():
+            if p not in movable and copy_id in free_at:
+                free_at[copy_id] = max(free_at[copy_id] or end, end)
+
+        assignment = {}
+        for p in sorted(movable, key=lambda p: (loans[p][1], p)):
+            current, start, end = loans[p]
+            free = [copy_id for copy_id, until in free_at.items() if until is None or until <= start]
+            if not free:
+                return None
+            copy_id = current if current in free else free[0]
+            free_at[copy_id] = end
+            assignment[p] = copy_id
+
+        for p, copy_id in assignment.items():
+            if p != pk and loans[p][0] != copy_id:
+                self.loans[p][0] = copy_id
+                self.moved[p] = copy_id
+        self.loans[pk] = [assignment[pk], borrow_date, return_date]
+        return assignment[pk]
+
+
+# Books get their BookInstance rows on first allocation: `copies` of them, at
+# least one. The book row is locked so concurrent approvals create
+# them only once.
+def create_missing_copies(book_ids):
+    for book in Book.objects.select_for_update().filter(pk__in=list(book_ids)).order_by('id'):
+        if BookInstance.objects.filter(book=book).exists():
+            continue
+        count = max(book.copies, 1)
+        BookInstance.objects.bulk_create([BookInstance(book=book) for _ in range(count)])
+        if book.copies != count:
+            book.copies = count
+            book.save(update_fields=['copies'])
+
+
+def lock_copy_schedules(book_ids, since, exclude=()):
+    """
+    Locks every copy of `book_ids`, creating them for books that have none, and
+    returns a CopySchedule per book id with the approved loans ending after
+    `since`, leaving out the requests in `exclude`.
+    """
+    book_ids = sorted(set(book_ids))
+    copies = defaultdict(list)
+
+    def lock_copies(ids):
+        for copy_id, book_id in BookInstance.objects.select_for_update().filter(book_id__in=ids) \
+                .order_by('id').values_list('id', 'book_id'):
+            copies[book_id].append(copy_id)
+
+    lock_copies(book_ids)
+    missing = [book_id for book_id in book_ids if book_id not in copies]
+    if missing:
+        create_missing_copies(missing)
+        lock_copies(missing)
+
+    loans = defaultdict(list)
+    for book_id, *loan in BorrowRequest.objects.filter(
+        book_id__in=book_ids,
+        status='approved',
+        return_date__gt=since
+    ).exclude(pk__in=list(exclude)).values_list('book_id', 'id', 'book_instance_id', 'borrow_date', 'return_date'):
+        loans[book_id].append(loan)
+
+    today = timezone.localdate()
+    return {book_id: CopySchedule(copies[book_id], loans[book_id], today) for book_id in book_ids}
+
+
+def move_loans(moved):
+    # bulk_update sends no post_save; moving a loan to another copy changes no period
+    if moved:
+        BorrowRequest.objects.bulk_update(
+            [BorrowRequest(pk=pk, book_instance_id=copy_id) for pk, copy_id in moved.items()], ['book_instance']
+        )
+
+
+# Locks a copy that no approved loan holds during the request's period. SKIP
+# LOCKED lets concurrent approvals of one title each take a different copy
+# instead of queueing on the same row. Returns the copy id, or None.
+def claim_free_copy(borrow_request):
+    # Every approved loan holds a copy (0015_assign_loan_copies gave older ones
+    # theirs); the filter keeps NULL out of the NOT IN below all the same
+    busy = overlapping_loans(borrow_request.borrow_date, borrow_request.return_date,
+                             book_id=borrow_request.book_id, book_instance__isnull=False).exclude(pk=borrow_request.pk)
+    copies = BookInstance.objects.select_for_update(skip_locked=True, of=('self',)).filter(
+        book_id=borrow_request.book_id
+    ).exclude(pk__in=busy.values('book_instance_id')).order_by('id').values_list('id', flat=True)
+
+    skipped = []
+    while True:
+        copy_id = copies.exclude(pk__in=skipped).first()
+        if copy_id is None:
+            return None
+        # A loan committed while the lookup ran is only seen by a new query; no
+        # other loan can be added to this copy while its lock is held
+        if not busy.filter(book_instance_id=copy_id).exists():
+            return copy_id
+        skipped.append(copy_id)
+
+
+def allocate_copy(borrow_request):
+    """
+    Returns the copy to reserve for `borrow_request` or raises NoCopyAvailable.
+    When no copy is free for the whole period (or the free ones are locked by
+    concurrent approvals, or the book has no copies yet), every copy of the
+    book is locked and the upcoming loans are rescheduled across them.
+    """
+    copy_id = claim_free_copy(borrow_request)
+    if copy_id is not None:
+        return copy_id
+
+    schedule = lock_copy_schedules([borrow_request.book_id], borrow_request.borrow_date,
+                                   exclude=[borrow_request.pk])[borrow_request.book_id]
+    copy_id = schedule.allocate(borrow_request.pk, borrow_request.borrow_date, borrow_request.return_date)
+    if copy_id is None:
+        raise NoCopyAvailable()
+    move_loans(schedule.moved)
+    return copy_id
+
+
+# Approves a borrow request and reserves a copy of the book for its period.
+def approve_borrow_request(pk):
+    with transaction.atomic():
+        borrow_request = BorrowRequest.objects.select_for_update().get(pk=pk)
+        if borrow_request.status == 'approved' and borrow_request.book_instance_id:
+            return borrow_request
+        previous_status = borrow_request.status
+
+        borrow_request.book_instance_id = allocate_copy(borrow_request)
+        borrow_request.status = 'approved'
+        borrow_request.save(update_fields=['status', 'book_instance'])
+        record_borrow_changes([(borrow_request, previous_status)])
+        transaction.on_commit(lambda: publish_borrow_requests('status_changed', [borrow_request]), robust=True)
+        return borrow_request
+
+
+# Denies a borrow request, giving up the copy reserved for it if it was approved.
+def deny_borrow_request(pk):
+    with transaction.atomic():
+        borrow_request = BorrowRequest.objects.select_for_update().get(pk=pk)
+        previous_status = borrow_request.status
+
+        borrow_request.status = 'denied'
+        borrow_request.book_instance = None
+        borrow_request.save(update_fields=['status', 'book_instance'])
+        record_borrow_changes([(borrow_request, previous_status)])
+        transaction.on_commit(lambda: publish_borrow_requests('status_changed', [borrow_request]), robust=True)
+        return borrow_request
+
+
+# Marks an approved loan as returned. Its copy is free from then on, for the
+# rest of its period too.
+def return_borrow_request(pk):
+    with transaction.atomic():
+        borrow_request = BorrowRequest.objects.select_for_update().get(pk=pk)
+        if borrow_request.status != 'approved':
+            raise NotOnLoan()
+
+        borrow_request.status = 'returned'
+        borrow_request.save(update_fields=['status'])
+        record_borrow_changes([(borrow_request, 'approved')])
+        transaction.on_commit(lambda: publish_borrow_requests('status_changed', [borrow_request]), robust=True)
+        return borrow_request
+
+
+# Applies many approve/deny decisions in one transaction with a constant number
+# of queries: the requests, the copies and the approved loans of every affected
+# book are each loaded once, and the changes are written back in bulk.
+# Returns one result per decision, in input order.
+def apply_borrow_decisions(decisions):
+    results = [{"id": decision.get("id"), "status": decision.get("status")} for decision in decisions]
+
+    with transaction.atomic():
+        wanted = {}
+        for result in results:
+            if result["status"] not in ("approved", "denied"):
+                result["error"] = "Invalid status"
+            elif not isinstance(result["id"], int) or isinstance(result["id"], bool):
+                result["error"] = "Invalid id"
+            elif result["id"] in wanted:
+                result["error"] = "Duplicate id in batch"
+            else:
+                wanted[result["id"]] = result
+
+        borrow_requests = BorrowRequest.objects.select_for_update().in_bulk(list(wanted))
+        approving, denying = [], []
+        for pk, result in wanted.items():
+            borrow_request = borrow_requests.get(pk)
+            if borrow_request is None:
+                result["error"] = "Borrow request not found"
+            elif result["status"] == "denied":
+                denying.append(borrow_request)
+            elif not borrow_request.book_instance_id:
+                approving.append(borrow_request)
+
+        # Denials are applied first, so the periods they give up can go to
+        # approvals in the same batch
+        changed_requests, changes = [], []
+        for borrow_request in denying:
+            changes.append((borrow_request, borrow_request.status))
+            borrow_request.status = 'denied'
+            borrow_request.book_instance = None
+            changed_requests.append(borrow_request)
+
+        # Copies and approved loans of the affected books. Requests approved
+        # earlier keep their copies unless this batch denies them.
+        schedules = {}
+        if approving:
+            schedules = lock_copy_schedules({r.book_id for r in approving}, min(r.borrow_date for r in approving),
+                                            exclude=[r.pk for r in denying + approving])
+
+        for borrow_request in approving:
+            copy_id = schedules[borrow_request.book_id].allocate(
+                borrow_request.pk, borrow_request.borrow_date, borrow_request.return_date
+            )
+            if copy_id is None:
+                wanted[borrow_request.pk]["error"] = "No copies of this book are available"
+                continue
+            changes.append((borrow_request, borrow_request.status))
+            borrow_request.status = 'approved'
+            borrow_request.book_instance_id = copy_id
+            changed_requests.append(borrow_request)
+
+        # Loans moved to another copy to make room; requests of this batch are
+        # written with their final copy below
+        batch_requests = {r.pk: r for r in changed_requests}
+        moved = {}
+        for schedule in schedules.values():
+            for pk, copy_id in schedule.moved.items():
+                if pk in batch_requests:
+                    batch_requests[pk].book_instance_id = copy_id
+                else:
+                    moved[pk] = copy_id
+        move_loans(moved)
+
+        if changed_requests:
+            BorrowRequest.objects.bulk_update(changed_requests, ['status', 'book_instance'])
+            record_borrow_changes(changes)
+            transaction.on_commit(lambda: publish_borrow_requests('status_changed', changed_requests), robust=True)
+
+        # bulk_update does not send post_save, so drop cached intervals here
+        for book_id in {r.book_id for r in changed_requests}:
+            transaction.on_commit(lambda book_id=book_id: conflict_checker.invalidate(book_id))
+
+    return results
+
+
+# Sweeps the approved loan periods of one book across [start, end) and returns
+# the sub-ranges in which fewer than `capacity` loans are active. Periods are
+# half-open like the borrow conflict check, so a loan returned on a date frees
+# the copy for a loan starting that same date.
+def free_ranges(periods, capacity, start, end):
+    events = defaultdict(int)
+    for borrow_date, return_date in periods:
+        events[max(borrow_date, start)] += 1
+        events[min(return_date, end)] -= 1
+
+    ranges, active, free_from = [], 0, start
+    for day in sorted(events):
+        if day >= end:
+            break
+        was_free = active < capacity
+        active += events[day]
+        if was_free and active >= capacity:
+            if free_from < day:
+                ranges.append((free_from, day))
+        elif not was_free and active < capacity:
+            free_from = day
+    if active < capacity and free_from < end:
+        ranges.append((free_from, end))
+    return ranges
+
+
+def is_fully_booked(periods, capacity, borrow_date, return_date):
+    # Every copy is lent on some day of [borrow_date, return_date)
+    return free_ranges(periods, capacity, borrow_date, return_date) != [(borrow_date, return_date)]
+
+
+# The number of loans each book can serve at once: its BookInstance rows, or
+# for books without any the copies create_missing_copies gives them on their
+# first approval.
+def book_capacities(book_ids):
+    return {
+        book_id: count or max(copies, 1)
+        for book_id, count, copies in Book.objects.filter(pk__in=list(book_ids))
+        .annotate(count=Count('instances')).values_list('id', 'count', 'copies')
+    }
+
+
+# Free borrowing ranges of several books across [start, end), computed from one
+# query for the books' capacities and one for their approved loans in the window.
+def book_availability(book_ids, start, end):
+    capacities = book_capacities(book_ids)
+    periods = defaultdict(list)
+    for book_id, borrow_date, return_date in BorrowRequest.objects.filter(
+        book_id__in=list(capacities),
+        status='approved',
+        borrow_date__lt=end,
+        return_date__gt=start
+    ).values_list('book_id', 'borrow_date', 'return_date'):
+        periods[book_id].append((borrow_date, return_date))
+
+    return {
+        book_id: {"copies": capacity, "free": free_ranges(periods[book_id], capacity, start, end)}
+        for book_id, capacity in capacities.items()
+    }
+
+
+ARCHIVE_COLUMNS = ('id', 'user_id', 'book_id', 'borrow_date', 'return_date', 'status', 'created_at', 'book_instance_id')
+
+
+# Moves one batch of closed borrow requests (returned or denied, ending before
+# `cutoff`) to the archive table, oldest ids first. Each batch is its own
+# transaction, so an interrupted run loses nothing and the next run picks up
+# where it stopped. Returns the number of requests moved.
+def archive_borrow_requests(cutoff, batch_size):
+    with transaction.atomic():
+        rows = list(BorrowRequest.objects.select_for_update(skip_locked=True).filter(
+            status__in=['returned', 'denied'],
+            return_date__lt=cutoff
+        ).order_by('id').values_list(*ARCHIVE_COLUMNS)[:batch_size])
+        if not rows:
+            return 0
+
+        BorrowRequestArchive.objects.bulk_create(
+            [BorrowRequestArchive(**dict(zip(ARCHIVE_COLUMNS, row))) for row in rows]
+        )
+        BorrowRequest.objects.filter(pk__in=[row[0] for row in rows]).delete()
+        return len(rows)
+
+
+# Latest borrow_date in the archive, or None when nothing is archived. Ranges
+# starting after it are answered from the hot table alone.
+def archive_horizon():
+    return BorrowRequestArchive.objects.aggregate(horizon=Max('borrow_date'))['horizon']
+
+
+# Querysets holding the borrow requests that match `filters` with a borrow_date
+# in [date_from, date_to], archived first. The archive is only included when the
+# range reaches back past archive_horizon().
+def borrow_history_querysets(date_from=None, date_to=None, **filters):
+    range_filters = {}
+    if date_from:
+        range_filters['borrow_date__gte'] = date_from
+    if date_to:
+        range_filters['borrow_date__lte'] = date_to
+
+    querysets = [BorrowRequest.objects.filter(**filters, **range_filters)]
+    horizon = archive_horizon()
+    if horizon is not None and (date_from is None or date_from <= horizon):
+        querysets.insert(0, BorrowRequestArchive.objects.filter(**filters, **range_filters).order_by('id'))
+    return querysets
@@ -0,0 +1,52 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from .authentication import user_cache
+from .catalog import bump_catalog_version
+from .models import Book, BookInstance, BorrowRequest, User
+from .search import get_search_backend
+from .services import conflict_checker
+
+
+@receiver([post_save, post_delete], sender=BorrowRequest)
+def invalidate_borrow_conflicts(sender, instance, **kwargs):
+    # Drop now, and again on commit in case a concurrent reader refilled the
+    # entry from the pre-commit state
+    conflict_checker.invalidate(instance.book_id)
+    transaction.on_commit(lambda: conflict_checker.invalidate(instance.book_id))
+
+
+@receiver([post_save, post_delete], sender=BookInstance)
+def sync_copy_count(sender, instance, created=True, **kwargs):
+    # Copies added or removed one at a time (e.g. in the admin)
+    if created:
+        Book.objects.filter(pk=instance.book_id).update(
+            copies=BookInstance.objects.filter(book_id=instance.book_id).count()
+        )
+        conflict_checker.invalidate(instance.book_id)
+        transaction.on_commit(lambda: conflict_checker.invalidate(instance.book_id))
+
+
+@receiver([post_save, post_delete], sender=User)
+def invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(instance.pk)
+    transaction.on_commit(lambda: user_cache.invalidate(instance.pk))
+
+
+@receiver([post_save, post_delete], sender=Book)
+def invalidate_catalog(sender, instance, **kwargs):
+    transaction.on_commit(bump_catalog_version)
+    # Book.copies sets the capacity of books without copies
+    transaction.on_commit(lambda: conflict_checker.invalidate(instance.pk))
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    transaction.on_commit(lambda: get_search_backend().add(instance))
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    book_id = instance.pk
+    transaction.on_commit(lambda: get_search_backend().remove(book_id))
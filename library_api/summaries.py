@@ -0,0 +1,152 @@
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .models import BorrowRequest, BorrowRequestArchive, UserBorrowSummary
+
+SUMMARY_FIELDS = ['pending_count', 'approved_count', 'denied_count', 'returned_count', 'loans', 'updated_at']
+
+
+def loan_entry(pk, book_id, borrow_date, return_date):
+    return [pk, book_id, borrow_date.isoformat(), return_date.isoformat()]
+
+
+def sort_loans(loans):
+    # By return date (ISO strings sort chronologically), then request id
+    loans.sort(key=lambda loan: (loan[3], loan[0]))
+
+
+# Summaries of `user_ids` computed from their borrow requests with a grouped
+# count per table and one query for the outstanding loans, which are never
+# archived. Returned unsaved, keyed by user id.
+def build_summaries(user_ids):
+    summaries = {user_id: UserBorrowSummary(user_id=user_id, loans=[]) for user_id in user_ids}
+    for model in (BorrowRequestArchive, BorrowRequest):
+        counts = model.objects.filter(user_id__in=list(summaries)).values('user_id', 'status') \
+            .annotate(count=Count('id')).order_by().values_list('user_id', 'status', 'count')
+        for user_id, status, count in counts:
+            field = f'{status}_count'
+            setattr(summaries[user_id], field, getattr(summaries[user_id], field) + count)
+
+    loans = BorrowRequest.objects.filter(user_id__in=list(summaries), status='approved') \
+        .values_list('user_id', 'id', 'book_id', 'borrow_date', 'return_date')
+    for row in loans:
+        summaries[row[0]].loans.append(loan_entry(*row[1:]))
+
+    for summary in summaries.values():
+        sort_loans(summary.loans)
+    return summaries
+
+
+def apply_changes(summary, changes):
+    for borrow_request, previous_status in changes:
+        if previous_status:
+            setattr(summary, f'{previous_status}_count', getattr(summary, f'{previous_status}_count') - 1)
+        setattr(summary, f'{borrow_request.status}_count', getattr(summary, f'{borrow_request.status}_count') + 1)
+
+        # Returned and denied loans leave the list
+        summary.loans = [loan for loan in summary.loans if loan[0] != borrow_request.pk]
+        if borrow_request.status == 'approved':
+            summary.loans.append(loan_entry(borrow_request.pk, borrow_request.book_id,
+                                            borrow_request.borrow_date, borrow_request.return_date))
+    sort_loans(summary.loans)
+
+
+def record_borrow_changes(changes):
+    """
+    Applies `changes`, pairs of (borrow request, its previous status or None when
+    it was just created), to the owners' summaries. Must run inside the
+    transaction that saved the requests, so the summaries commit with them.
+    A missing summary is built from the tables instead, which already include
+    the changes.
+    """
+    by_user = defaultdict(list)
+    for borrow_request, previous_status in changes:
+        by_user[borrow_request.user_id].append((borrow_request, previous_status))
+    if not by_user:
+        return
+
+    summaries = UserBorrowSummary.objects.select_for_update().in_bulk(list(by_user))
+    missing = [user_id for user_id in by_user if user_id not in summaries]
+    if missing:
+        built = build_summaries(missing)
+        try:
+            with transaction.atomic():
+                UserBorrowSummary.objects.bulk_create(built.values())
+        except IntegrityError:
+            # Some were created concurrently, from a state without these changes:
+            # insert the rest one by one and apply the changes to the others
+            for user_id in missing:
+                try:
+                    with transaction.atomic():
+                        built[user_id].save(force_insert=True)
+                except IntegrityError:
+                    summaries[user_id] = UserBorrowSummary.objects.select_for_update().get(pk=user_id)
+
+    now = timezone.now()
+    for user_id, summary in summaries.items():
+        apply_changes(summary, by_user[user_id])
+        summary.updated_at = now
+    if summaries:
+        UserBorrowSummary.objects.bulk_update(summaries.values(), SUMMARY_FIELDS)
+
+
+# The summary row of one user, built and stored on first use
+def get_borrow_summary(user_id):
+    summary = UserBorrowSummary.objects.filter(pk=user_id).first()
+    if summary is None:
+        summary = build_summaries([user_id])[user_id]
+        try:
+            with transaction.atomic():
+                summary.save(force_insert=True)
+        except IntegrityError:
+            summary = UserBorrowSummary.objects.get(pk=user_id)
+    return summary
+
+
+def describe_summary(summary, today=None):
+    """
+    API representation of a summary. Outstanding loans are classified against
+    `today`: active from borrow_date through return_date, overdue (not returned
+    yet) after it, upcoming before borrow_date.
+    """
+    today = (today or timezone.localdate()).isoformat()
+    active, overdue, upcoming = [], 0, 0
+    for pk, book_id, borrow_date, return_date in summary.loans:
+        if return_date < today:
+            overdue += 1
+        elif borrow_date > today:
+            upcoming += 1
+        else:
+            active.append({"id": pk, "book": book_id, "borrow_date": borrow_date, "return_date": return_date})
+    # Loans are sorted by return date, so the first one not yet due is next
+    next_due = next((loan[3] for loan in summary.loans if loan[3] >= today), None)
+    return {
+        "user": summary.user_id,
+        "pending": summary.pending_count,
+        "approved": summary.approved_count,
+        "denied": summary.denied_count,
+        "returned": summary.returned_count,
+        "active": len(active),
+        "overdue": overdue,
+        "upcoming": upcoming,
+        "next_due_date": next_due,
+        "active_loans": active,
+        "updated_at": summary.updated_at.isoformat() if summary.updated_at else None,
+    }
+
+
+# Recomputes the summaries of `user_ids` from the tables, creating missing rows
+def rebuild_summaries(user_ids):
+    with transaction.atomic():
+        existing = UserBorrowSummary.objects.select_for_update().in_bulk(list(user_ids))
+        built = build_summaries(user_ids)
+        now = timezone.now()
+        for summary in built.values():
+            summary.updated_at = now
+        UserBorrowSummary.objects.bulk_update([built[pk] for pk in existing], SUMMARY_FIELDS)
+        UserBorrowSummary.objects.bulk_create([summary for pk, summary in built.items() if pk not in existing],
+                                              ignore_conflicts=True)
+    return len(built)
@@ -1,16 +1,42 @@
 import csv
 import traceback
-from django.http import HttpResponse
+import datetime
+import itertools
+import zlib
+from django.conf import settings
+from django.http import StreamingHttpResponse
+from django.utils.dateparse import parse_date, parse_datetime
+from django.utils import timezone
+from django.utils.http import parse_etags
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
+from rest_framework.parsers import JSONParser, MultiPartParser
 from .models import Book, BorrowRequest, User
 from .serializers import UserSerializer, BookSerializer, BorrowRequestSerializer
+from .serializers import book_list_serializer, borrow_request_list_serializer
+from .pagination import BookCursorPagination, BookSearchPagination, BorrowRequestCursorPagination
+from .search import get_search_backend
+from .routers import ReplicaReadMixin
+from .catalog import catalog_cache, catalog_cache_timeout, get_catalog_version, catalog_response_key
+from .importers import iter_rows, import_books, provision_users
+from .batch import InvalidBatch, parse_batch, build_subrequest, execute_batch
+from .idempotency import idempotent
+from .services import has_borrow_conflict, approve_borrow_request, deny_borrow_request, apply_borrow_decisions, NoCopyAvailable
+from .services import return_borrow_request, NotOnLoan
+from .services import book_availability, borrow_history_querysets, create_borrow_request
+from .summaries import get_borrow_summary, describe_summary
 import logging
 
 logger = logging.getLogger(__name__)
 
+
+# Pseudo-buffer for csv.writer: write() hands the formatted row straight back
+class Echo:
+    def write(self, value):
+        return value
+
 # View for creating a book (for librarian)
 class CreateBookView(APIView):
     permission_classes = [IsAuthenticated]
@@ -23,15 +49,151 @@ class CreateBookView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-# View for listing books (for users and librarians)
+# View for bulk uploading books from a CSV or NDJSON file (for librarian)
+class BulkCreateBooksView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({"error": "A 'file' upload is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        fmt = request.query_params.get('format') or ('ndjson' if upload.name.endswith(('.ndjson', '.jsonl')) else 'csv')
+        if fmt not in ('csv', 'ndjson'):
+            return Response({"error": "Format must be 'csv' or 'ndjson'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            batch_size = int(request.query_params.get('batch_size', 0)) or None
+        except ValueError:
+            return Response({"error": "batch_size must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            report = import_books(iter_rows(upload.file, fmt), batch_size=batch_size)
+        except UnicodeDecodeError:
+            return Response({"error": "File must be UTF-8 encoded."}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report, status=status.HTTP_200_OK)
+
+
+# Applies ?fields= / ?exclude= (comma separated) to a list serializer, so both
+# the output and the selected columns are limited. Raises ValueError for unknown fields.
+def sparse_fieldset(query_params, list_serializer, always=()):
+    fields = [name.strip() for name in query_params.get('fields', '').split(',') if name.strip()]
+    exclude = [name.strip() for name in query_params.get('exclude', '').split(',') if name.strip()]
+    if not fields and not exclude and set(always) <= set(list_serializer.lookups):
+        return list_serializer
+    return list_serializer.project(fields, exclude, always)
+
+
+# Applies the librarian queue filters: ?status=, ?book=, ?user=, borrow_date
+# range (?borrow_date_from= / ?borrow_date_to=) and created_at range
+# (?created_after= / ?created_before=, date or ISO datetime). Raises ValueError
+# with a message for the client on malformed values.
+def filter_borrow_requests(queryset, query_params):
+    value = query_params.get('status')
+    if value:
+        statuses = value.split(',')
+        valid = [choice for choice, _ in BorrowRequest.STATUS_CHOICES]
+        if any(choice not in valid for choice in statuses):
+            raise ValueError(f"Invalid 'status', expected one of: {', '.join(valid)}.")
+        queryset = queryset.filter(status__in=statuses) if len(statuses) > 1 else queryset.filter(status=value)
+
+    for param in ('book', 'user'):
+        value = query_params.get(param)
+        if value:
+            if not value.isdigit():
+                raise ValueError(f"Invalid '{param}', expected an id.")
+            queryset = queryset.filter(**{f'{param}_id': int(value)})
+
+    for param, lookup in (('borrow_date_from', 'borrow_date__gte'), ('borrow_date_to', 'borrow_date__lte')):
+        value = query_params.get(param)
+        if value:
+            try:
+                parsed = parse_date(value)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                raise ValueError(f"Invalid '{param}' date, expected YYYY-MM-DD.")
+            queryset = queryset.filter(**{lookup: parsed})
+
+    for param, lookup in (('created_after', 'created_at__gte'), ('created_before', 'created_at__lt')):
+        value = query_params.get(param)
+        if value:
+            try:
+                parsed = parse_datetime(value) or parse_date(value)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                raise ValueError(f"Invalid '{param}', expected YYYY-MM-DD or an ISO 8601 datetime.")
+            if not isinstance(parsed, datetime.datetime):
+                parsed = datetime.datetime.combine(parsed, datetime.time.min)
+            if settings.USE_TZ and timezone.is_naive(parsed):
+                parsed = timezone.make_aware(parsed)
+            queryset = queryset.filter(**{lookup: parsed})
+
+    return queryset
+
+
+# Parses the optional ?from= / ?to= borrow_date range of the history endpoints.
+# Raises ValueError for malformed dates.
+def parse_history_range(query_params):
+    bounds = []
+    for param in ('from', 'to'):
+        value = query_params.get(param)
+        parsed = None
+        if value:
+            try:
+                parsed = parse_date(value)
+            except ValueError:
+                parsed = None
+            if parsed is None:
+                raise ValueError(f"Invalid '{param}' date, expected YYYY-MM-DD.")
+        bounds.append(parsed)
+    return bounds
+
+
+# Borrow history rows from the hot table and, when the range needs it, the archive
+def borrow_history_rows(list_serializer, date_range, **filters):
+    return itertools.chain.from_iterable(
+        list_serializer.values(queryset) for queryset in borrow_history_querysets(*date_range, **filters)
+    )
+
+
+def build_catalog_page(request, list_serializer, view=None):
+    paginator = BookCursorPagination()
+    rows = paginator.paginate_queryset(list_serializer.values(Book.objects.all(), named=True), request, view=view)
+    return paginator.get_paginated_response(list_serializer.serialize(rows)).data
+
+
+# View for listing books (for users and librarians). Catalog reads stay on the
+# primary: a page built from a lagging replica would be cached under the new
+# catalog version, and the cache already absorbs repeated reads.
 class BooksView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        books = Book.objects.all()
-        serializer = BookSerializer(books, many=True)
-        return Response(serializer.data)
-
+        try:
+            # The cursor needs the id of each row even when it is not requested
+            list_serializer = sparse_fieldset(request.query_params, book_list_serializer, always=['id'])
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Catalog pages are cached per catalog version; a matching If-None-Match
+        # is answered before anything is queried or serialized
+        key, etag = catalog_response_key(request, get_catalog_version())
+        headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+        if_none_match = request.headers.get('If-None-Match')
+        if if_none_match and (etag in parse_etags(if_none_match) or if_none_match.strip() == '*'):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+
+        cache = catalog_cache()
+        data = cache.get(key)
+        if data is None:
+            data = build_catalog_page(request, list_serializer, view=self)
+            cache.set(key, data, catalog_cache_timeout(cache))
+        return Response(data, headers=headers)
+
+    @idempotent
     def post(self, request):
         serializer = BorrowRequestSerializer(data=request.data, context={'request': request})  # Pass request context
 
@@ -40,67 +202,169 @@ class BooksView(APIView):
             borrow_date = serializer.validated_data['borrow_date']
             return_date = serializer.validated_data['return_date']
 
-            # Check for overlapping borrow requests
-            if BorrowRequest.objects.filter(
-                book=book,
-                status='approved',
-                borrow_date__lt=return_date,
-                return_date__gt=borrow_date
-            ).exists():
+            # Check that some copy is free on every day of the period
+            if has_borrow_conflict(book, borrow_date, return_date):
                 return Response({"error": "This book is already borrowed during the requested period."},
                                  status=status.HTTP_400_BAD_REQUEST)
 
-            borrow_request = serializer.save()
+            borrow_request = create_borrow_request(serializer)
             return Response(BorrowRequestSerializer(borrow_request).data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+# View for searching books by title, author or publisher (for users and librarians)
+class BookSearchView(ReplicaReadMixin, APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "A search query 'q' is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            list_serializer = sparse_fieldset(request.query_params, book_list_serializer, always=['id'])
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        paginator = BookSearchPagination()
+        book_ids = paginator.paginate_queryset(get_search_backend().search(query), request, view=self)
+        rows = {row.id: row for row in list_serializer.values(Book.objects.filter(pk__in=book_ids), named=True)}
+        data = list_serializer.serialize(rows[pk] for pk in book_ids if pk in rows)
+        return paginator.get_paginated_response(data)
+
+
+# View for the free borrowing periods of one or many books (for users and librarians)
+class BookAvailabilityView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request):
+        try:
+            book_ids = [int(pk) for pk in request.query_params.get('books', '').split(',') if pk.strip()]
+        except ValueError:
+            return Response({"error": "books must be a comma separated list of ids."}, status=status.HTTP_400_BAD_REQUEST)
+        max_books = getattr(settings, 'AVAILABILITY_MAX_BOOKS', 100)
+        if not book_ids or len(book_ids) > max_books:
+            return Response({"error": f"Pass between 1 and {max_books} book ids in 'books'."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            start = parse_date(request.query_params.get('start', '')) or datetime.date.today()
+            end = parse_date(request.query_params.get('end', '')) or start + datetime.timedelta(days=90)
+        except ValueError:
+            return Response({"error": "start and end must be valid YYYY-MM-DD dates."}, status=status.HTTP_400_BAD_REQUEST)
+        max_days = getattr(settings, 'AVAILABILITY_MAX_DAYS', 366)
+        if not start < end or (end - start).days > max_days:
+            return Response({"error": f"end must be after start and at most {max_days} days later."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        availability = book_availability(book_ids, start, end)
+        # Any request with borrow_date >= start and return_date <= end of a free range fits
+        return Response({
+            "start": start,
+            "end": end,
+            "books": [
+                {
+                    "book": book_id,
+                    "copies": availability[book_id]["copies"],
+                    "free": [{"start": s, "end": e} for s, e in availability[book_id]["free"]],
+                }
+                for book_id in dict.fromkeys(book_ids) if book_id in availability
+            ],
+        })
+
+
 # View for handling borrow requests (for users)
 class BorrowRequestsView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        borrow_requests = BorrowRequest.objects.all()
-        serializer = BorrowRequestSerializer(borrow_requests, many=True)
-        return Response(serializer.data)
+        paginator = BorrowRequestCursorPagination()
+        try:
+            borrow_requests = filter_borrow_requests(BorrowRequest.objects.all(), request.query_params)
+            # The cursor is read from the ordering column of each row
+            ordering = paginator.get_ordering(request, borrow_requests, self)
+            list_serializer = sparse_fieldset(request.query_params, borrow_request_list_serializer,
+                                              always=[ordering[0].lstrip('-')])
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        rows = paginator.paginate_queryset(list_serializer.values(borrow_requests, named=True), request, view=self)
+        return paginator.get_paginated_response(list_serializer.serialize(rows))
     
+    @idempotent
     def post(self, request):
-        serializer = BorrowRequestSerializer(data=request.data)
+        serializer = BorrowRequestSerializer(data=request.data, context={'request': request})
         if serializer.is_valid():
             book = serializer.validated_data['book']
             borrow_date = serializer.validated_data['borrow_date']
             return_date = serializer.validated_data['return_date']
 
-            # Check for overlapping borrow requests
-            if BorrowRequest.objects.filter(
-                book=book,
-                status='approved',
-                borrow_date__lt=return_date,
-                return_date__gt=borrow_date
-            ).exists():
+            # Check that some copy is free on every day of the period
+            if has_borrow_conflict(book, borrow_date, return_date):
                 return Response({"error": "This book is already borrowed during the requested period."},
                                  status=status.HTTP_400_BAD_REQUEST)
 
-            borrow_request = serializer.save(user=request.user)
+            borrow_request = create_borrow_request(serializer, user=request.user)
             return Response(BorrowRequestSerializer(borrow_request).data, status=status.HTTP_201_CREATED)
         
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     def put(self, request, pk):
+        status_choice = request.data.get("status")
+        if status_choice not in ["approved", "denied", "returned"]:
+            return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            borrow_request = BorrowRequest.objects.get(pk=pk)
+            if status_choice == "approved":
+                approve_borrow_request(pk)
+            elif status_choice == "returned":
+                return_borrow_request(pk)
+            else:
+                deny_borrow_request(pk)
         except BorrowRequest.DoesNotExist:
             return Response({"error": "Borrow request not found"}, status=status.HTTP_404_NOT_FOUND)
+        except NoCopyAvailable:
+            return Response({"error": "No copies of this book are available"}, status=status.HTTP_409_CONFLICT)
+        except NotOnLoan:
+            return Response({"error": "Only approved borrow requests can be returned"}, status=status.HTTP_409_CONFLICT)
 
-        status_choice = request.data.get("status")
-        if status_choice not in ["approved", "denied"]:
-            return Response({"error": "Invalid status"}, status=status.HTTP_400_BAD_REQUEST)
-
-        borrow_request.status = status_choice
-        borrow_request.save()
         return Response({"message": f"Borrow request {status_choice} successfully"}, status=status.HTTP_200_OK)
 
 
+# View for approving/denying many borrow requests at once (for librarian)
+class BorrowRequestBatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        decisions = request.data.get("decisions") if isinstance(request.data, dict) else request.data
+        if not isinstance(decisions, list) or not all(isinstance(d, dict) for d in decisions):
+            return Response({"error": "Expected a list of {id, status} decisions."}, status=status.HTTP_400_BAD_REQUEST)
+
+        max_size = getattr(settings, 'BORROW_BATCH_MAX_SIZE', 1000)
+        if len(decisions) > max_size:
+            return Response({"error": f"A batch may contain at most {max_size} decisions."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        results = apply_borrow_decisions(decisions)
+        return Response({"results": results}, status=status.HTTP_200_OK)
+
+
+# View for running several API calls in one round-trip (for users and librarians).
+# The batch is authenticated once and each sub-request runs as that user.
+class BatchView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        try:
+            parsed = parse_batch(request.data)
+        except InvalidBatch as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+        subrequests = [build_subrequest(request, request.user, request.auth, *entry) for entry in parsed]
+        results, rolled_back = execute_batch(subrequests, atomic=bool(request.data.get('atomic')))
+        return Response({"responses": results, "rolled_back": rolled_back}, status=status.HTTP_200_OK)
+
+
 class CreateLibraryUserView(APIView):
     permission_classes = [IsAuthenticated]
 
@@ -120,7 +384,34 @@ class CreateLibraryUserView(APIView):
             return Response({"error": "An error occurred while creating the user."}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class UserBorrowHistoryView(APIView):
+# View for creating many users from a JSON list or an uploaded CSV/NDJSON/JSON file (for librarian)
+class BulkCreateLibraryUsersView(APIView):
+    permission_classes = [IsAuthenticated]
+    parser_classes = [JSONParser, MultiPartParser]
+
+    def post(self, request):
+        upload = request.FILES.get('file')
+        if upload is not None:
+            name = upload.name.lower()
+            fmt = 'ndjson' if name.endswith(('.ndjson', '.jsonl')) else 'json' if name.endswith('.json') else 'csv'
+            rows = iter_rows(upload.file, request.query_params.get('format') or fmt)
+        elif isinstance(request.data, list):
+            rows = enumerate(request.data, start=1)
+        else:
+            return Response({"error": "Expected a JSON list of users or a 'file' upload."},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        try:
+            results = provision_users(rows, shared_pool=True)
+        except (ValueError, UnicodeDecodeError) as e:
+            return Response({"error": f"Could not read upload: {e}"}, status=status.HTTP_400_BAD_REQUEST)
+
+        created = sum(1 for result in results if result["status"] == "created")
+        return Response({"created": created, "failed": len(results) - created, "results": results},
+                        status=status.HTTP_200_OK)
+
+
+class UserBorrowHistoryView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request, user_id):
@@ -129,44 +420,91 @@ class UserBorrowHistoryView(APIView):
         except User.DoesNotExist:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
 
-        borrow_requests = BorrowRequest.objects.filter(user_id=user_id)
-        serializer = BorrowRequestSerializer(borrow_requests, many=True)
-        return Response(serializer.data)
+        try:
+            date_range = parse_history_range(request.query_params)
+            list_serializer = sparse_fieldset(request.query_params, borrow_request_list_serializer)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(list_serializer.serialize(borrow_history_rows(list_serializer, date_range, user_id=user_id)))
 
 
 # View for personal borrow history (for users)
-class PersonalBorrowHistoryView(APIView):
+class PersonalBorrowHistoryView(ReplicaReadMixin, APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        borrow_requests = BorrowRequest.objects.filter(user=request.user)
-        serializer = BorrowRequestSerializer(borrow_requests, many=True)
-        return Response(serializer.data)
+        try:
+            date_range = parse_history_range(request.query_params)
+            list_serializer = sparse_fieldset(request.query_params, borrow_request_list_serializer)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(list_serializer.serialize(borrow_history_rows(list_serializer, date_range, user=request.user)))
 
 
-class DownloadBorrowHistoryView(APIView):
+# View for a user's own borrowing summary: counts by status, active loans and
+# the next due date, answered from one summary row (for users)
+class PersonalBorrowSummaryView(APIView):
     permission_classes = [IsAuthenticated]
 
     def get(self, request):
-        borrow_requests = BorrowRequest.objects.filter(user=request.user)
+        return Response(describe_summary(get_borrow_summary(request.user.pk)))
 
-        if not borrow_requests:
-            return Response({"error": "No borrow history found for this user."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Create the HttpResponse object with CSV header
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename="borrow_history.csv"'
+# View for the borrowing summary of any user (for librarians)
+class UserBorrowSummaryView(APIView):
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, user_id):
+        if not User.objects.filter(id=user_id).exists():
+            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        return Response(describe_summary(get_borrow_summary(user_id)))
+
 
-        writer = csv.writer(response)
-        writer.writerow(['Book Title', 'Borrow Date', 'Return Date', 'Status'])
+class DownloadBorrowHistoryView(ReplicaReadMixin, APIView):
+    permission_classes = [IsAuthenticated]
 
-        for request in borrow_requests:
-            writer.writerow([
-                request.book.title,
-                request.borrow_date,
-                request.return_date,
-                request.status
-            ])
+    chunk_size = 2000
 
+    def get(self, request):
+        # Optional date range on borrow_date (?from=YYYY-MM-DD&to=YYYY-MM-DD)
+        try:
+            date_range = parse_history_range(request.query_params)
+        except ValueError as e:
+            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        querysets = borrow_history_querysets(*date_range, user=request.user)
+
+        if not any(queryset.exists() for queryset in querysets):
+            return Response({"error": "No borrow history found for this user."}, status=status.HTTP_404_NOT_FOUND)
+
+        # Join the book title in the same query and stream rows in chunks, archived
+        # rows first. The rows are read after the view returns, so the database is
+        # pinned now.
+        rows = itertools.chain.from_iterable(
+            queryset.using(queryset.db).order_by('id').values_list(
+                'book__title', 'borrow_date', 'return_date', 'status'
+            ).iterator(chunk_size=self.chunk_size)
+            for queryset in querysets
+        )
+
+        if request.query_params.get('compress') == 'gzip':
+            response = StreamingHttpResponse(self.gzip_stream(self.csv_rows(rows)), content_type='application/gzip')
+            response['Content-Disposition'] = 'attachment; filename="borrow_history.csv.gz"'
+        else:
+            response = StreamingHttpResponse(self.csv_rows(rows), content_type='text/csv')
+            response['Content-Disposition'] = 'attachment; filename="borrow_history.csv"'
         return response
 
+    def csv_rows(self, rows):
+        writer = csv.writer(Echo())
+        yield writer.writerow(['Book Title', 'Borrow Date', 'Return Date', 'Status'])
+        for row in rows:
+            yield writer.writerow(row)
+
+    def gzip_stream(self, chunks):
+        compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+        for chunk in chunks:
+            data = compressor.compress(chunk.encode('utf-8'))
+            if data:
+                yield data
+        yield compressor.flush()
+
@@ -0,0 +1,13 @@
+"""
+URL configuration used for requests served through ASGI.
+
+The read-heavy library_api endpoints resolve to their async views first; every
+other route is shared with the WSGI configuration in library_management.urls.
+"""
+from django.urls import path, include
+
+from .urls import urlpatterns as wsgi_urlpatterns
+
+urlpatterns = [
+    path('api/', include('library_api.async_urls')),
+] + wsgi_urlpatterns
@@ -47,7 +47,11 @@ INSTALLED_APPS = [
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'library_api.authentication.CachedJWTAuthentication',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'library_api.renderers.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
     ],
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
@@ -60,7 +64,121 @@ REST_FRAMEWORK = {
     },
 }
 
+SIMPLE_JWT = {
+    'TOKEN_OBTAIN_SERIALIZER': 'library_api.serializers.LibraryTokenObtainPairSerializer',
+    # Embeds a password hash claim, so tokens die with a password change; it
+    # also versions the entries of the authenticated user cache
+    'CHECK_REVOKE_TOKEN': True,
+}
+
+# Authenticated user cache (library_api.authentication.CachedJWTAuthentication).
+# With AUTH_TRUST_TOKEN_CLAIMS the user is built from signed token claims without a lookup.
+AUTH_USER_CACHE_SIZE = 10000
+AUTH_USER_CACHE_TTL = 60
+AUTH_TRUST_TOKEN_CLAIMS = False
+
+# JSON encoder behind library_api.renderers.FastJSONRenderer: 'orjson' (used when
+# installed) or 'json' for the stock DRF renderer
+JSON_RENDERER_BACKEND = 'orjson'
+
+# Catalog pagination (cursor based, see library_api/pagination.py)
+BOOKS_PAGE_SIZE = 50
+BOOKS_MAX_PAGE_SIZE = 500
+
+# Catalog response cache. Point CATALOG_CACHE_ALIAS at a shared backend
+# (memcached/redis) when running several workers so they share one version
+# counter and ETags; pages then live CATALOG_CACHE_TIMEOUT seconds. With the
+# per-process local-memory cache, pages and version expire after
+# CATALOG_LOCAL_CACHE_TIMEOUT seconds, as writes through other workers go unseen.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Idempotency keys must be seen by every worker and must not be culled
+    # while their responses can still be replayed; the table is created with
+    # `manage.py createcachetable`.
+    'idempotency': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'library_idempotency_cache',
+        'OPTIONS': {'MAX_ENTRIES': 1000000},
+    },
+}
+CATALOG_CACHE_ALIAS = 'default'
+CATALOG_CACHE_TIMEOUT = 3600
+CATALOG_LOCAL_CACHE_TIMEOUT = 5
+
+# OpenAPI document written by `manage.py generate_openapi_schema` at build time
+# and served by the swagger route; the Swagger UI page is cached this long
+OPENAPI_SCHEMA_PATH = BASE_DIR / 'openapi.json'
+SWAGGER_UI_CACHE_TIMEOUT = 3600
+
+# Book search: library_api.search.InMemorySearchBackend or DatabaseSearchBackend
+# (MySQL FULLTEXT). The in-memory index is rebuilt after BOOK_SEARCH_INDEX_TTL seconds.
+BOOK_SEARCH_BACKEND = 'library_api.search.InMemorySearchBackend'
+BOOK_SEARCH_INDEX_TTL = 300
+
+# Rows per validated upsert batch for bulk book imports
+BOOK_IMPORT_BATCH_SIZE = 1000
+
+# Bulk user provisioning: rows per batch, password hashing processes (default:
+# all cores) and the fewest passwords of a batch worth handing to them
+USER_PROVISION_BATCH_SIZE = 1000
+USER_PROVISION_WORKERS = None
+USER_PROVISION_PARALLEL_MIN = 64
+
+# Availability calendar limits: books per call and days per window
+AVAILABILITY_MAX_BOOKS = 100
+AVAILABILITY_MAX_DAYS = 366
+
+# Largest number of decisions accepted by the borrow request batch endpoint
+BORROW_BATCH_MAX_SIZE = 1000
+
+# Borrow request events streamed to librarians (ASGI only). The in-process hub
+# serves one worker process; library_api.events.SpoolEventHub fans events out
+# to every process on the host through spool files named after
+# BORROW_EVENTS_SPOOL_PATH, rotated at BORROW_EVENTS_SPOOL_MAX_BYTES.
+BORROW_EVENTS_HUB = 'library_api.events.InProcessEventHub'
+BORROW_EVENTS_SPOOL_PATH = BASE_DIR / 'borrow_events.spool'
+BORROW_EVENTS_SPOOL_MAX_BYTES = 64 * 1024 * 1024
+BORROW_EVENTS_BUFFER_SIZE = 1000
+BORROW_EVENTS_KEEPALIVE = 15
+
+# Idempotency-Key support on borrow request creation: the cache holding the
+# keys, how long a response is replayed, how long a key stays claimed by a
+# request that never finishes, and how long a duplicate waits for the original
+# request to finish. The cache must be shared by all workers and keep every key
+# for IDEMPOTENCY_TTL; a local-memory cache is per process and culls, so it only
+# suits development.
+IDEMPOTENCY_CACHE_ALIAS = 'idempotency'
+IDEMPOTENCY_TTL = 86400
+IDEMPOTENCY_PENDING_TIMEOUT = 60
+IDEMPOTENCY_WAIT = 10
+
+# On-demand profiling of staff requests (library_api.profiling): requests sent
+# with X-Profile-Request, or picked at PROFILING_SAMPLE_RATE, get their Python
+# stacks sampled every PROFILING_INTERVAL seconds and their SQL recorded, with
+# EXPLAIN for queries slower than PROFILING_EXPLAIN_THRESHOLD seconds. The last
+# PROFILING_MAX_CAPTURES captures are kept in PROFILING_DIR.
+PROFILING_SAMPLE_RATE = 0.0
+PROFILING_INTERVAL = 0.005
+PROFILING_EXPLAIN_THRESHOLD = 0.1
+PROFILING_MAX_QUERIES = 2000
+PROFILING_DIR = BASE_DIR / 'profiles'
+PROFILING_MAX_CAPTURES = 100
+
+# /api/batch/: most sub-requests per call, and threads running read sub-requests
+BATCH_MAX_REQUESTS = 20
+BATCH_MAX_WORKERS = 4
+
+# archive_borrow_requests moves returned/denied requests ending more than
+# BORROW_ARCHIVE_AFTER_DAYS ago to borrow_request_archive, in batches
+BORROW_ARCHIVE_AFTER_DAYS = 365
+BORROW_ARCHIVE_BATCH_SIZE = 1000
+
 MIDDLEWARE = [
+    'library_api.metrics.RequestMetricsMiddleware',
+    'library_api.middleware.AsgiUrlconfMiddleware',
+    'library_api.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -68,10 +186,20 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'library_api.profiling.RequestProfilingMiddleware',
 ]
 
+# Request metrics served at /metrics (Prometheus text format)
+METRICS_ALLOWED_IPS = ['127.0.0.1', '::1']
+METRICS_QUERY_THRESHOLD = 50
+
 ROOT_URLCONF = 'library_management.urls'
 
+# Requests served through ASGI resolve here first, reaching the async read views
+ASGI_URLCONF = 'library_management.asgi_urls'
+
+AUTH_USER_MODEL = 'library_api.User'
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -106,9 +234,33 @@ DATABASES = {
         'PASSWORD': 'dbda',
         'HOST': 'localhost',
         'PORT': '3306',        
-    }
+        # Persistent connections, checked before reuse
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    # Read replica of `default`; read-only views are routed here by
+    # library_api.routers.PrimaryReplicaRouter. Add more aliases for more replicas.
+    # 'replica': {
+    #     'ENGINE': 'django.db.backends.mysql',
+    #     'NAME': 'library_management',
+    #     'USER': 'root',
+    #     'PASSWORD': 'dbda',
+    #     'HOST': 'replica-host',
+    #     'PORT': '3306',
+    #     'CONN_MAX_AGE': 60,
+    #     'CONN_HEALTH_CHECKS': True,
+    #     'TEST': {'MIRROR': 'default'},
+    # },
 }
 
+DATABASE_ROUTERS = ['library_api.routers.PrimaryReplicaRouter']
+
+# Replica aliases to read from (defaults to every alias other than `default`),
+# and how long a user's reads stay on the primary after they write
+REPLICA_DATABASES = None
+REPLICA_STICKY_SECONDS = 5
+REPLICA_STICKY_CACHE_ALIAS = 'default'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
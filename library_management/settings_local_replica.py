@@ -0,0 +1,33 @@
+"""
+Local settings with two SQLite files standing in for the MySQL primary and a
+read replica, to exercise library_api.routers.PrimaryReplicaRouter without a
+replication setup:
+
+    export DJANGO_SETTINGS_MODULE=library_management.settings_local_replica
+    python manage.py migrate
+    python manage.py migrate --database=replica
+    # "replicate": copy primary.sqlite3 over replica.sqlite3 whenever needed
+    python manage.py runserver
+
+Nothing is replicated automatically, so writes only show up on replica reads
+after the copy, which makes routing and read-your-writes stickiness visible.
+"""
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'primary.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+    },
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'replica.sqlite3',
+        'CONN_MAX_AGE': 60,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    },
+}